@@ -3,33 +3,278 @@
 # Feature: Grammar checking module
 # This application is for checking all possible grammatical errors in a sentence
 
-import nltk
+import argparse
+import codecs
+import functools
+import hashlib
+import json
 import re
 import logging
-import spacy
 import string
-import language_check
-import nltk.data
-from nltk.stem import WordNetLemmatizer as wnl
-from flask import Flask, request, jsonify
-from nltk import sent_tokenize
+import threading
+import time
+from bisect import bisect_right
+from flask import Flask, Response, request, jsonify, stream_with_context
+from document_sessions import DocumentSessions
+from metrics import Metrics
+from language_tool_pool import CONTEXT_RULES, DISABLED_RULES, LanguageToolError, LanguageToolPool, RemoteLanguageTool
+from parallel_check import ParallelChecker
+from pronoun_rules import PronounRules
+from sentence_cache import SentenceCache
+from structured_logging import SENTENCE_LOGGER, setup_logging
+from taggers import SpacyTagger, make_tagger
 app = Flask(__name__)
+setup_logging()
+sentence_log = logging.getLogger(SENTENCE_LOGGER)
+
+# bump whenever a check or a message changes, so that cached results of the old checks are not used
+RULES_VERSION = '3'
+
+# message templates of the error codes of the checks, {0}, {1}, ... are the args of a finding. The codes and
+# templates of the pronoun rules are in pronoun_rules.py, the ones of LanguageTool are its rule ids with 'LT_' before.
+MESSAGES = {
+    'END_PUNCTUATION': "Every sentence should end with either of '.', '?' or '!'.",
+    'NOUN_CAPITALISE': "The noun '{0}' should be capitalised.",
+    'HYPHEN_AT_END': 'Sentence should not end with "-".',
+    'HYPHEN_SPACE': "There shouldn't be any spaces before or after the '-' symbol.",
+    'USE_AND': "Should have used 'and' here.",
+    'USE_ETCETERA': 'Should use "et cetera" between multiple nouns.',
+}
+
+# checks which never read the tags, run first when a request has a time budget. etcetera_check isn't one of them, it
+# tags the word before the first comma.
+CHEAP_CHECKS = ('hyphen_space', 'end_with_punctuation')
+# brackets and quotes, which LanguageTool pairs up across sentences. An apostrophe inside a word isn't one of them.
+PAIRED_SYMBOLS = re.compile(r'''[()\[\]{}"“”‘«»]|(?<!\w)'|'(?!\w)''')
+# sentences tagged together when a request has a time budget, the deadline is only looked at between batches
+BUDGET_BATCH_SIZE = 8
+
+
+def sent_tokenize(text):
+    """
+    Splits a text into sentences with nltk, which is only imported the first time a text is split
+    :param text: the text to be split
+    :return: list of sentences
+    """
+    from nltk import sent_tokenize as nltk_sent_tokenize
+    return nltk_sent_tokenize(text)
+
+
+def split_sentences(text):
+    """
+    Splits a text into sentences with sent_tokenize and finds where each sentence is in the text
+    :param text: the text to be split
+    :return: list of (sentence, start, end) with the character offsets of each sentence in the text
+    """
+    spans = []
+    position = 0
+    for s in sent_tokenize(text):
+        start = text.find(s, position)
+        if start < 0:
+            # sent_tokenize gave back something which isn't in the text as is, keep the last known position
+            start = position
+        position = start + len(s)
+        spans.append((s, start, position))
+    return spans
+
+
+def finding(code, start, end, args=(), message=None):
+    """
+    An error found in a sentence
+    :param code: the error code
+    :param start: character offset in the sentence where the error starts
+    :param end: character offset in the sentence where the error ends
+    :param args: the args of the message template of the code
+    :param message: the message, only for the errors which don't have a template
+    :return: the finding
+    """
+    found = {'code': code, 'start': start, 'end': end, 'args': list(args)}
+    if message is not None:
+        found['message'] = message
+    return found
+
+
+def map_findings(findings, cleaned, sentence):
+    """
+    Moves the offsets of findings in a cleaned sentence to the sentence it was cleaned from. clean_sentence only swaps
+    whole words, so an offset is moved to the same place in the same word of the sentence.
+    :param findings: list of findings in the cleaned sentence
+    :param cleaned: the cleaned sentence
+    :param sentence: the sentence
+    :return: list of findings in the sentence
+    """
+    if cleaned == sentence or not findings:
+        return findings
+
+    cleaned_words = [(m.start(), m.end()) for m in re.finditer(r'\S+', cleaned)]
+    words = [(m.start(), m.end()) for m in re.finditer(r'\S+', sentence)]
+    cleaned_starts = [start for start, _ in cleaned_words]
+
+    def move(offset, end):
+        index = bisect_right(cleaned_starts, offset - 1 if end else offset) - 1
+        if index < 0 or index >= len(words):
+            return min(offset, len(sentence))
+        delta = offset - cleaned_words[index][0]
+        length = cleaned_words[index][1] - cleaned_words[index][0]
+        if delta >= length:
+            # past the end of the word, in the whitespace after it
+            limit = words[index + 1][0] if index + 1 < len(words) else len(sentence)
+            return min(words[index][1] + delta - length, limit)
+        return min(words[index][0] + delta, words[index][1])
+
+    moved = []
+    for found in findings:
+        found = dict(found)
+        found['start'], found['end'] = move(found['start'], False), move(found['end'], True)
+        moved.append(found)
+    return moved
+
+
+class TaggedSentence:
+    """
+    A sentence tagged once, shared by all of the checks instead of every check tagging the words again.
+    The sentence is split on whitespace the same way the checks split it, with one Penn Treebank tag per word.
+    """
+
+    def __init__(self, sentence, doc):
+        """
+        :param sentence: the sentence that was parsed
+        :param doc: the tokens of the sentence given by the tagger, like a spaCy Doc
+        """
+        self.text = sentence
+        spans = [(m.start(), m.group()) for m in re.finditer(r'\S+', sentence)]
+        self.offsets = [start for start, _ in spans]
+        self.words = [word for _, word in spans]
+        self.lower = [word.lower() for word in self.words]
+        # lower case words without the punctuation around them, which is what the rules compare
+        self.bare = [word.strip(string.punctuation) for word in self.lower]
+        self.tags = [''] * len(self.words)
+
+        # tags of the tokens by their character offset, used for the words the regex checks pull out.
+        self.token_offsets = []
+        self.token_tags = []
+
+        # a word takes the tag of its first token that isn't punctuation, so 'played.' is tagged as 'played'.
+        tagged_by_punct = [False] * len(self.words)
+        for token in doc:
+            if token.is_space:
+                continue
+            self.token_offsets.append(token.idx)
+            self.token_tags.append(token.tag_)
+            index = bisect_right(self.offsets, token.idx) - 1
+            if index < 0:
+                continue
+            if not self.tags[index] or (tagged_by_punct[index] and not token.is_punct):
+                self.tags[index] = token.tag_
+                tagged_by_punct[index] = token.is_punct
+
+    def tag_at(self, offset):
+        """
+        Finds the tag of the token found at a character offset of the sentence
+        :param offset: character offset in the sentence
+        :return: the pos tag, or an empty string if there is no token there
+        """
+        index = bisect_right(self.token_offsets, offset) - 1
+        if index < 0:
+            return ''
+        return self.token_tags[index]
 
 
 class GrammarCheck:
 
-    def __init__(self):
-        self.error_list = []
-        self.error_dic = dict()
-        self.rule_dic = {'i': ['am', 'could', 'should', 'have', 'did', 'had', 'will', 'was', 'can', 'shall', 'may', 'might', 'must', 'would'],
-                         'he': ['is', 'could', 'should', 'did',  'has', 'will', 'had', 'was', 'can', 'shall', 'may', 'might', 'must', 'would'],
-                         'you': ['are', 'had', 'could', 'should', 'did',  'have', 'will', 'were', 'can', 'shall', 'may', 'might', 'must', 'would']
-                         }
-        self.tool = language_check.LanguageTool('en-US')
-        self.lemmatizer = wnl()
-        self.nlp = spacy.load('en')
+    def __init__(self, batch_size=256, language_check_chars=5000, cache=None, tool=None, metrics=None, tagger=None,
+                 parallel=None):
+        """
+        :param batch_size: number of sentences tagged together when checking many texts
+        :param language_check_chars: roughly how many characters of text are sent to LanguageTool in a single call
+        :param cache: SentenceCache for the errors found in each sentence, sentences are always checked if None
+        :param tool: LanguageToolPool the sentences are checked on, a pool of language_check instances with the
+                     DISABLED_RULES and CONTEXT_RULES turned off if None
+        :param metrics: Metrics the time spent in every stage and check is recorded in, a new one if None
+        :param tagger: the tagger giving the Penn Treebank tags the checks use, spaCy's if None, see taggers.py
+        :param parallel: ParallelChecker long documents are split over, every sentence is checked in this process if
+                         None
+        """
+        self.batch_size = batch_size
+        self.cache = cache
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.metrics.describe('sentences_total', 'Sentences checked, including the ones found in the cache')
+        self.metrics.describe('errors_total', 'Errors found per check')
+        self.metrics.describe('stage_seconds', 'Time spent in each stage of the pipeline')
+        self.metrics.describe('check_seconds', 'Time spent in each check per sentence')
+        self.metrics.describe('parallel_sentences_total', 'Sentences checked on the pool of processes')
+        self.metrics.describe('cache_hits_total', 'Sentences found in the cache')
+        self.metrics.describe('cache_misses_total', 'Sentences not found in the cache')
+        self.metrics.describe('cache_evictions_total', 'Sentences evicted from the cache')
+        self.metrics.collectors.append(self.cache_metrics)
+        self.language_check_chars = language_check_chars
+        self.pronoun_rules = PronounRules()
+        self.tool = tool if tool is not None else LanguageToolPool(
+            language='en-US', disabled_rules=DISABLED_RULES + CONTEXT_RULES)
+        # the models are loaded on first use, or up front by warm_up
+        self.tagger = tagger if tagger is not None else SpacyTagger(metrics=self.metrics)
+        self.rules_version = self.get_rules_version()
+        self.parallel = parallel
+
+        self._lemmatizer = None
+        self._load_lock = threading.Lock()
+        self.ready = threading.Event()
+
+    @property
+    def lemmatizer(self):
+        """
+        The WordNet lemmatizer, made the first time it is needed
+        """
+        if self._lemmatizer is None:
+            with self._load_lock:
+                if self._lemmatizer is None:
+                    from nltk.stem import WordNetLemmatizer
+                    self._lemmatizer = WordNetLemmatizer()
+        return self._lemmatizer
+
+    def warm_up(self):
+        """
+        Loads the tagger, the nltk sentence splitter and the LanguageTool instances up front and checks a sentence, so
+        that the first request isn't the one paying for it. The checker is ready once this returns.
+        """
+        start = time.perf_counter()
+        self.tagger.warm_up()
+        self.tool.warm_up()
+        sent_tokenize('I am warming up. The grammar check is loading.')
+        # straight through the checks, so the warm up sentence isn't cached or counted
+        list(self.check_uncached_sentences(['I am warming up the grammar check.'], self.batch_size))
+        self.ready.set()
+        logging.info("Warmed up in {:.2f} seconds".format(time.perf_counter() - start))
+
+    def cache_metrics(self):
+        """
+        Counters of the sentence cache for the metrics
+        :return: list of (name, value)
+        """
+        if self.cache is None:
+            return []
+        stats = self.cache.stats()
+        return [('cache_hits_total', stats['hits']), ('cache_misses_total', stats['misses']),
+                ('cache_evictions_total', stats['evictions'])]
+
+    def sentence_checks(self):
+        """
+        The checks run on every sentence after LanguageTool, in the order their errors are given back
+        :return: list of (name, method) where the method takes the cleaned sentence and its TaggedSentence and gives
+                 back a list of findings
+        """
+        return [('check_pronouns', self.check_pronouns_findings),
+                ('noun_capitalise', self.noun_capitalise_findings),
+                # ('end_with_punctuation', self.end_with_punctuation_findings),
+                ('hyphen_space', self.hyphen_space_findings)]
 
-        logging.basicConfig(filename="log_file.log", format='%(asctime)s %(message)s', filemode='w', level=logging.DEBUG)
+    def get_rules_version(self):
+        """
+        Version of the rule set, which changes whenever the rules or the way they are configured change
+        :return: hash of the rule set
+        """
+        rules = [RULES_VERSION, self.pronoun_rules.version(), self.tool.rule_config(), self.tagger.config()]
+        return hashlib.sha1(json.dumps(rules, sort_keys=True).encode('utf-8')).hexdigest()
 
     def clean_sentence(self, sentence):
         """
@@ -50,417 +295,616 @@ class GrammarCheck:
 
         return sentence
 
-    def end_with_punctuation(self, sentence):
+    def end_with_punctuation(self, sentence, tagged=None):
         """
         All sentences should end with some punctuation.
         :param sentence: Sentence to be parsed.
+        :param tagged: not used, only there so that all of the checks are called the same way
+        :return: list of the errors found
         """
+        return self.format_findings(self.end_with_punctuation_findings(sentence, tagged))
+
+    def end_with_punctuation_findings(self, sentence, tagged=None):
+        """
+        end_with_punctuation, giving back where the errors are
+        :return: list of findings, see format_findings
+        """
+        findings = []
         if not re.match(r'[\.?!]$', sentence[-1]):
-            self.error_list.append("Every sentence should end with either of '.', '?' or '!'.")
+            findings.append(finding('END_PUNCTUATION', len(sentence) - 1, len(sentence)))
+
+        return findings
 
-    def noun_capitalise(self, sentence):
+    def noun_capitalise(self, sentence, tagged=None):
         """
         Method for capitalisation of Nouns
         :param sentence: sentence to be checked for errors
+        :param tagged: the TaggedSentence of the sentence, it is tagged here if not given
+        :return: list of the errors found
         """
-        sen_split = sentence.split()
-        for word in sen_split:
+        return self.format_findings(self.noun_capitalise_findings(sentence, tagged))
+
+    def noun_capitalise_findings(self, sentence, tagged=None):
+        """
+        noun_capitalise, giving back where the errors are
+        :return: list of findings, see format_findings
+        """
+        findings = []
+        if tagged is None:
+            tagged = self.tag_sentence(sentence)
+
+        for start, word, tag in zip(tagged.offsets, tagged.words, tagged.tags):
             # removing the punctuation from the word extracted.
-            word = word.translate(str.maketrans('', '', string.punctuation))
-            if self.nlp(word)[0].tag_ in ['NNP', 'NNPS']:
-                if word[0] != word[0].upper():
-                    self.error_list.append("The noun '" + word.strip('.') + "' should be capitalised.")
+            bare = word.translate(str.maketrans('', '', string.punctuation))
+            if bare and tag in ['NNP', 'NNPS']:
+                if bare[0] != bare[0].upper():
+                    # the word without the punctuation around it
+                    end = start + len(word.rstrip(string.punctuation))
+                    start += len(word) - len(word.lstrip(string.punctuation))
+                    findings.append(finding('NOUN_CAPITALISE', start, end, [bare.strip('.')]))
+
+        return findings
 
-    def hyphen_space(self, sentence):
+    def hyphen_space(self, sentence, tagged=None):
         """
         Method for checking spaces before '-'. There shouldn't be any whitespace before or after '-'
         :param sentence: sentence to be checked for the error
-        :return: None
+        :param tagged: not used, only there so that all of the checks are called the same way
+        :return: list of the errors found
+        """
+        return self.format_findings(self.hyphen_space_findings(sentence, tagged))
+
+    def hyphen_space_findings(self, sentence, tagged=None):
+        """
+        hyphen_space, giving back where the errors are
+        :return: list of findings, see format_findings
         """
+        findings = []
         if '-' in sentence:
+            hyphen = sentence.find('-')
             if sentence[-1] == '-':
-                self.error_list.append('Sentence should not end with "-".')
-            elif sentence[sentence.find('-') - 1] == ' ' or sentence[sentence.find('-') + 1] == ' ':
-                self.error_list.append("There shouldn't be any spaces before or after the '-' symbol.")
+                findings.append(finding('HYPHEN_AT_END', len(sentence) - 1, len(sentence)))
+            elif sentence[hyphen - 1] == ' ' or sentence[hyphen + 1] == ' ':
+                # the hyphen with the spaces around it
+                start = hyphen - 1 if hyphen > 0 and sentence[hyphen - 1] == ' ' else hyphen
+                end = hyphen + 2 if sentence[hyphen + 1] == ' ' else hyphen + 1
+                findings.append(finding('HYPHEN_SPACE', start, end))
+
+        return findings
+
+    def check_pronouns(self, sentence, tagged=None):
+        """
+        Method for the pronouns 'I', 'He' and 'You'. All of the rules in pronoun_rules are found in one pass.
+        :param sentence: sentence to be checked for errors
+        :param tagged: the TaggedSentence of the sentence, it is tagged here if not given
+        :return: list of the errors found
+        """
+        return self.format_findings(self.check_pronouns_findings(sentence, tagged))
 
-    def check_for_i(self, sentence):
+    def check_pronouns_findings(self, sentence, tagged=None):
+        """
+        check_pronouns, giving back where the errors are. The code of a finding is the id of the pronoun rule.
+        :return: list of findings, see format_findings
+        """
+        if tagged is None:
+            tagged = self.tag_sentence(sentence)
+        return self.pronoun_rules.find(tagged)
+
+    def check_for_i(self, sentence, tagged=None):
         """
         Method for 'I'
         :param sentence: sentence to be checked for errors
-        :return: None
+        :param tagged: the TaggedSentence of the sentence, it is tagged here if not given
+        :return: list of the errors found
         """
-        if sentence[-1] == '?':
-            return
+        if tagged is None:
+            tagged = self.tag_sentence(sentence)
+        return [message for _, message in self.pronoun_rules.match(tagged, 'i')]
 
-        # change sentence to lower case and split and save to list
-        sen_split = sentence.lower().split()
-
-        # find the pos tags of the sentence using nltk library
-        text = nltk.word_tokenize(sentence)
-
-        if sen_split[0] == 'i':
-
-            # checking each of the sentences with the rules
-            if 'i' in sen_split:
-
-                # word next to 'I'
-                if len(sen_split) - sen_split.index("i") > 1:
-                    next_word = sen_split[sen_split.index("i") + 1]  # the word next to 'I'
-
-                    # pos tag of the word next to 'I'
-                    next_word_tag = self.nlp(next_word)[0].tag_  # the postag of the next word
-
-                    # the word after 'I have/had' should be like 'played/eaten/it/said'
-                    if len(sen_split) - sen_split.index("i") >= 3:
-                        if next_word in ['have', 'had']\
-                                and sen_split[sen_split.index("i") + 2] not in ['not']\
-                                and self.nlp(sen_split[sen_split.index("i") + 2])[0].tag_ not in ['VBD', 'VBN', 'DT', 'RB']:
-                            self.error_list.append("With 'I have/had', second form of the verb should be used ("\
-                                                   + sen_split[sen_split.index("i") + 2].strip('.')+ "), like played, gone.")
-
-                    """After 'I have been' there should be 'ing' with the verb."""
-                    if len(sen_split) - sen_split.index("i") >= 4:
-                        if next_word == 'have'\
-                           and sen_split[sen_split.index("i") + 2] == 'been'\
-                           and sen_split[sen_split.index("i") + 3][-3:] != 'ing'\
-                           and self.nlp(sen_split[sen_split.index("i") + 3])[0].tag_ not in ['JJ', 'VBG', 'RB', 'IN', 'UH', 'VBN', 'VBD']:
-                            self.error_list.append("With 'I have been', the verb form should be past tense\
-                             or present participle ("+ sen_split[sen_split.index("i") + 3].strip('.')+"), like playing, gone." )
-
-                    if next_word == 'been':
-                        self.error_list.append("'been' cannot come after 'I'.")
-
-                    if next_word[-3:] == 'ing':
-                        self.error_list.append("Present participle form of the verb shouldn't be used ("+ next_word + ").")
-
-                    """checking for given such examples: I [work (NN)], I [do (VB)], I [worked (VBN)], I [walked (VBD)].
-                        Checking for the the second word here. """
-                    if next_word_tag not in ['NN', 'VBN', 'VB', 'VBD', 'NNS', 'VBP', 'JJ', 'IN', 'UH'] and next_word not in self.rule_dic['i']:
-                        self.error_list.append("Wrong usage of 'I'. 'I' should be used with a verb (work, play, etc.) or modals (would, could, etc).")
-
-                    """ checking length of sentence after 'I' to be greater than two. """
-                    if len(sen_split) - sen_split.index("i") > 2:
-
-                        """ If the first word is 'I', the third and fourth words are 'have' and 'been' respectively, 
-                             the second word must be would/could/should."""
-                        if sen_split[sen_split.index("i") + 2] == 'have'\
-                                and sen_split[sen_split.index("i") + 3] == 'been'\
-                                and self.nlp(next_word)[0].tag_ != "MD":
-                            self.error_list.append('You should use modals (would, could, etc.) after the Pronoun here.')
-
-                        """ If the first word is 'I' & the third word is 'been', the second word should be have/had."""
-                        if sen_split[sen_split.index("i") + 2] == 'been'\
-                                and next_word not in ['have', 'had']:
-                            self.error_list.append("You should use have or had after the pronoun here.")
-
-                    if len(sen_split) - sen_split.index("i") >= 3:
-
-                        """Checking for determiners before a noun."""
-                        if next_word in ['am', 'was']\
-                           and self.nlp(sen_split[sen_split.index("i") + 2])[0].tag_ in ['NN', 'JJS' 'NNP']:
-                           self.error_list.append("You should use a determiner (a, an, the, this, etc) before the Noun \
-                           or Superlative adjective.")
-
-                        """Checking sentences like I am reading, I am playing"""
-                        if next_word in ['am', 'was']\
-                                and self.nlp(sen_split[sen_split.index("i") + 2])[0].tag_ \
-                                not in ['NN', 'RB', 'JJ', 'VBN', 'IN', 'DT', 'NNP', 'VBP', 'PRP$']\
-                                and sen_split[sen_split.index("i") + 2][-3:] != 'ing':
-                            self.error_list.append("Present or past participle form of the verb should be used ("\
-                                                   + sen_split[sen_split.index("i") + 2].strip('.')+"), like playing, gone, etc.")
-
-                        if len(sen_split) - sen_split.index("i") >= 5:
-
-                            """Word after 'I have been' should have 'ing' or like, 'dead/told/made' """
-                            if sen_split[sen_split.index(next_word) + 2][-3:] != 'ing'\
-                                    and self.nlp(sen_split[sen_split.index(next_word) + 3])[0].tag_ not in ['JJ', 'VBN', 'VBD']\
-                                    and sen_split[sen_split.index("i") + 1] == 'have'\
-                                    and sen_split[sen_split.index("i") + 2] == 'been':
-                                self.error_list.append("With sentence formations like 'I have been' we use present or past participle \
-                                form of the verb ("+sen_split[sen_split.index(next_word) + 3].strip('.')\
-                                                       +") like, playing, done, gone, etc.")
-
-                        # if the word after 'I' is would, could or should
-                        if self.nlp(next_word)[0].tag_ == "MD":
-                            """checking the word after would, could or should, it should be, I would sleep, I would not pee or 
-                            I would 'have', I would be"""
-                            if self.nlp(sen_split[sen_split.index(next_word) + 1])[0].tag_ not in ['NN', 'VBG', 'RB', 'VB']\
-                                    and sen_split[sen_split.index(next_word) + 1] not in ['have', 'not']:
-                                self.error_list.append("After 'I would', verb or adverb should be used like do, play, go, etc.")
-
-                        if len(sen_split) - sen_split.index("i") >= 5:
-                            """Word after 'I would have been' should have 'ing' """
-                            if sen_split[sen_split.index(next_word) + 3][-3:] != 'ing'\
-                                    and self.nlp(sen_split[sen_split.index(next_word) + 3])[0].tag_ not in ['VBG', 'JJ', 'VBN', 'VBD']\
-                                    and sen_split[sen_split.index("i") + 2] == 'have'\
-                                    and sen_split[sen_split.index("i") + 3] == 'been':
-                                self.error_list.append("With sentence formations like 'I would have been' we use present\
-                                 or past participle form of the verb ("+sen_split[sen_split.index(next_word) + 3].strip('.')\
-                                                       + ") like, playing, gone, etc.")
-
-    def check_for_he(self, sentence):
+    def check_for_he(self, sentence, tagged=None):
         """
         Method for 'He'
         :param sentence: sentence to be checked for errors
-        :return: None
-        """
-        if sentence[-1] == '?':
-                return
-
-        # change sentence to lower case and split and save to list
-        sen_split = sentence.lower().split()
-
-        # find the pos tags of the sentence using nltk library
-        text = nltk.word_tokenize(sentence)
-
-        if sen_split[0] == 'he':
-
-            if 'he' in sen_split and len(sen_split) - sen_split.index("he") > 1:
-                # word next to 'he'
-                next_word = sen_split[sen_split.index("he") + 1]  # the word next to 'He'
-
-                # pos tag of the word next to 'he'
-                next_word_tag = self.nlp(next_word)[0].tag_  # the postag of the next word
-
-                if next_word == 'been':
-                    self.error_list.append("'been' should not be used here.")
-
-                if next_word[-3:] == 'ing':
-                    self.error_list.append("Present participle form of the verb shouldn't be used with the pronoun ("
-                                           + next_word + "), like playing, singing, etc.")
-
-                """checking for given such examples: He [works (NNS)], He [does (VBZ)], He [worked (VBN)], He [walked (VBD)].
-                    Checking for the the second word here. """
-                if next_word_tag not in ['NNS', 'VBZ', 'VBD', 'VBN', 'IN'] and next_word not in self.rule_dic['he']:
-                    self.error_list.append("Pronoun should be used with a third form of verb like plays, works, etc,or modals like would, could, should, etc. (" + next_word+")")
-
-                if len(sen_split) - sen_split.index("he") >= 2:
-                    if next_word in ['has', 'had'] and sen_split[sen_split.index("he") + 2][-3:] != 'ing':
-                        self.error_list.append("Second form of the verb should be used with has/had ("\
-                                               + sen_split[sen_split.index("he") + 2].strip('.') + ") like plays, works, etc.")
-
-                    """ checking length of sentence after 'he' to be greater than two. """
-                if len(sen_split) - sen_split.index("he") >= 4:
-
-                    """ If the first word is 'He', the third and fourth words are 'have' and 'been' respectively, 
-                         the second word must be would/could/should."""
-                    if sen_split[sen_split.index("he") + 2] == 'have'\
-                            and sen_split[sen_split.index("he") + 3] == 'been'\
-                            and self.nlp(next_word)[0].tag_ != "MD":
-                        self.error_list.append('You should use modals after the pronoun like would, could, etc.')
-
-                    """ If the first word is 'he' and the third word is 'been', the second word should be has/had."""
-                    if sen_split[sen_split.index("he") + 2] == 'been' and next_word not in ['has', 'had']:
-                        self.error_list.append("One should use has or had.")
-
-                    if len(sen_split) - sen_split.index("he") >= 4:
-                        """Word after 'He has been' should have 'ing' or 'sick'"""
-                        if sen_split[sen_split.index(next_word) + 2][-3:] != 'ing'\
-                                and self.nlp(sen_split[sen_split.index(next_word) + 2])[0].tag_ \
-                                not in ['JJ', 'VBG', 'RB', 'IN', 'UH', 'VBD', 'VBN']\
-                                and sen_split[sen_split.index("he") + 1] in ['has', 'had']\
-                                and sen_split[sen_split.index("he") + 2] == 'been':
-                            self.error_list.append("Wrong form of the verb is used here ("\
-                                                   + sen_split[sen_split.index(next_word) + 2].strip('.') + ").")
-
-                    # if the word after 'He' is would, could or should
-                    if len(sen_split) - sen_split.index("he") >= 3:
-
-                        """Checking for determiners before a noun."""
-                        if next_word in ['is', 'was']\
-                                and self.nlp(sen_split[sen_split.index("he") + 2])[0].tag_ in ['NN', 'JJS', 'NNP']:
-                            self.error_list.append("You should use a determiner before the Noun \
-                            or Superlative adjective like a, an, the, this, etc.")
-
-                        """Checking sentences like He is/was reading, He is/was playing"""
-                        if next_word in ['is', 'was']\
-                                and self.nlp(sen_split[sen_split.index("he") + 2])[0].tag_ \
-                                not in ['JJ', 'VBG', 'UH', 'JJR', 'RB', 'PRP', 'PRP$', 'DT', 'IN', 'VBP', 'NN']\
-                                and sen_split[sen_split.index("he") + 2][-3:] != 'ing':
-                            self.error_list.append("The present or past participle form of the verb should be used ("
-                                                   + sen_split[sen_split.index("he") + 2].strip('.') + ') like playing, done, etc.')
-
-                        if self.nlp(next_word)[0].tag_ == "MD":
-
-                            """checking the word after would, could or should, it should be, He would sleep, He would not pee or 
-                            He would 'have', He would be"""
-                            if self.nlp(sen_split[sen_split.index(next_word) + 1])[0].tag_ not in ['NN', 'VB', 'IN']\
-                                    and sen_split[sen_split.index(next_word) + 1] not in ['have', 'not']:
-                                self.error_list.append("After a pronoun followed by 'would', a verb or an adverb should be used ("
-                                                       + sen_split[sen_split.index(next_word) + 1].strip('.')
-                                                       + ") like sleep, see, etc.")
-
-                            if len(sen_split) - sen_split.index("he") >= 5:
-                                """Word after 'He would have been' should have 'ing' """
-                                if sen_split[sen_split.index(next_word) + 3][-3:] != 'ing'\
-                                        and self.nlp(sen_split[sen_split.index(next_word) + 3])[0].tag_ \
-                                        not in ['JJ', 'VBG', 'RB', 'VBN', 'VBD']\
-                                        and sen_split[sen_split.index("he") + 2] == 'have'\
-                                        and sen_split[sen_split.index("he") + 3] == 'been'\
-                                        and self.nlp(next_word)[0].tag_ == "MD":
-                                    self.error_list.append("There is some mistake after the noun/pronoun and 'would have been' ("
-                                                           + sen_split[sen_split.index(next_word) + 3].strip('.') + ").")
-
-    def check_for_you(self, sentence):
+        :param tagged: the TaggedSentence of the sentence, it is tagged here if not given
+        :return: list of the errors found
+        """
+        if tagged is None:
+            tagged = self.tag_sentence(sentence)
+        return [message for _, message in self.pronoun_rules.match(tagged, 'he')]
+
+    def check_for_you(self, sentence, tagged=None):
         """
         Method for 'You'
         :param sentence: sentence to be checked for errors
-        :return: None
+        :param tagged: the TaggedSentence of the sentence, it is tagged here if not given
+        :return: list of the errors found
         """
-        if sentence[-1] == '?':
-            return
-
-        # change sentence to lower case and split and save to list
-        sen_split = sentence.lower().split()
-
-        # find the pos tags of the sentence using nltk library
-        text = nltk.word_tokenize(sentence)
-
-        if sen_split[0] == 'you':
-
-            if 'you' in sen_split and len(sen_split) - sen_split.index("you") > 1:
-                # word next to 'you'
-                next_word = sen_split[sen_split.index("you") + 1]  # the word next to 'you'
-
-                # pos tag of the word next to 'you'
-                next_word_tag = self.nlp(next_word)[0].tag_  # the postag of the next word
-
-                # check if 'been' is there after 'you' which is wrong
-                if next_word == 'been':
-                    self.error_list.append("'been' cannot come after the pronoun/noun.")
-
-                # check if the word after 'they' has 'ing' before it, i.e., it's a verb (playing).
-                if next_word[-3:] == 'ing':
-                    self.error_list.append("Present participle form of the verb should NOT be used after the "
-                                           "pronoun/noun ( "
-                                           + next_word + ") like play, work.")
-
-                """checking for given such examples: you [work (NN)], you [do (VB)], you [walked (VBD)].
-                    Checking for the the second word here. """
-                if next_word_tag not in ['NN', 'VB', 'VBD', 'VBP', 'VBN', 'IN'] and next_word not in self.rule_dic['you']:
-                    self.error_list.append("Pronouns/nouns should be used with a verb or modals ("
-                                           + next_word + ") like you love, you sing.")
-
-                """ checking length of sentence after 'you' to be greater than two. """
-                if len(sen_split) - sen_split.index("you") >= 3:
-
-                    """ If the first word is 'you', the third and fourth words are 'have' and 'been' respectively, 
-                         the second word must be would/could/should."""
-                    if sen_split[sen_split.index("you") + 2] == 'have'\
-                            and sen_split[sen_split.index("you") + 3] == 'been'\
-                            and self.nlp(next_word)[0].tag_ != "MD":
-                        self.error_list.append('You should use modals like would, could, etc here.')
-
-                    """ If the first word is 'you' and the third word is 'been', the second word should be has/had."""
-                    if sen_split[sen_split.index("you") + 2] == 'been'\
-                            and next_word not in ['have', 'had']:
-                        self.error_list.append("You should use have or had after the pronoun.")
-
-                    """Checking sentences like 'you are reading, you are playing"""
-                    if next_word in ['are', 'were']\
-                            and self.nlp(sen_split[sen_split.index("you") + 2])[0].tag_ \
-                            not in ['JJ', 'VBG', 'UH', 'JJR', 'IN', 'VBN', 'RB', 'NNP', 'RB', 'DT', 'JJS']\
-                            and sen_split[sen_split.index("you") + 2][-3:] != 'ing':
-                        self.error_list.append("The present or past participle form of the verb should be used ("
-                                               + sen_split[sen_split.index("you") + 2].strip('.') + ") like reading, "
-                                                                                                    "gone, etc.")
-
-                    if len(sen_split) - sen_split.index("you") >= 4:
-                        """Word after 'you have been' should have 'ing' """
-                        if sen_split[sen_split.index(next_word) + 2][-3:] != 'ing'\
-                                and self.nlp(sen_split[sen_split.index(next_word) + 2])[0].tag_ \
-                                not in ['JJ', 'VBG', 'RB', 'IN', 'UH']\
-                                and sen_split[sen_split.index("you") + 1] in ['have', 'had']\
-                                and sen_split[sen_split.index("you") + 2] == 'been':
-                            self.error_list.append("With sentence formations like 'you have been' we use present or "
-                                                   "past participle form of the verb (" + sen_split[sen_split.index\
-                                                    (next_word) + 2].strip('.') + ") like gone, singing.")
-
-                    # if the word after 'you' is would, could or should
-                    if len(sen_split) - sen_split.index("you") >= 3:
-                        if self.nlp(next_word)[0].tag_ == "MD":
-                            """checking the word after would, could or should, it should be, you would sleep, 
-                            you would not pee or you would 'have', you would be """
-                            if self.nlp(sen_split[sen_split.index(next_word) + 1])[0].tag_ not in ['NN', 'VB']\
-                                    and sen_split[sen_split.index(next_word) + 1] not in ['have', 'not']:
-                                self.error_list.append("After 'you would', 'a noun, verb or adverb' is used ("\
-                                                       + sen_split[sen_split.index(next_word) + 1].strip('.') + ").")
-
-                            if len(sen_split) - sen_split.index("you") >= 5:
-                                """Word after 'you would have been' should have 'ing' """
-                                if sen_split[sen_split.index(next_word) + 3][-3:] != 'ing'\
-                                        and self.nlp(sen_split[sen_split.index(next_word) + 3])[0].tag_ not in ['JJ', 'VBG']\
-                                        and sen_split[sen_split.index("you") + 2] == 'have'\
-                                        and sen_split[sen_split.index("you") + 3] == 'been'\
-                                        and self.nlp(next_word)[0].tag_ == "MD":
-                                    self.error_list.append("With sentence formations like 'you would have been'"
-                                                           "we use present or past participle form of the verb ("
-                                                           + sen_split[sen_split.index(next_word) + 3].strip
-                                                               ('.') + ") like told, singing, gone, etc.")
+        if tagged is None:
+            tagged = self.tag_sentence(sentence)
+        return [message for _, message in self.pronoun_rules.match(tagged, 'you')]
 
     def using_grammar_check(self, sentence):
         """
         Using the Language Check Tool
         :param sentence: sentence to be checked for errors
-        :return: None
+        :return: list of the errors found
         """
         """Using the language check for first suggestions."""
-        matches = self.tool.check(sentence)
-        if len(matches) > 0:
-            for i in range(len(matches)):
-                if matches[i].msg not in ['Possible typo: you repeated a whitespace', 'Add a space between sentences', 'Possible spelling mistake found']:
-                    self.error_list.append(matches[i].msg)
+        return self.language_check_messages(self.tool.check(sentence))
+
+    def using_grammar_check_many(self, sentences, deadline=None, owners=None):
+        """
+        Using the Language Check Tool on many sentences together. The sentences of a text are joined into groups of
+        about language_check_chars characters, so that there is one LanguageTool round trip per group instead of one
+        per sentence, and the matches are given back to the sentence they start in, cut at its end. The groups are
+        checked at the same time on the LanguageTool pool, and are made small enough that every instance of the pool
+        has some of them. A sentence with brackets or quotes is a group of its own, so that LanguageTool doesn't pair
+        them up with the ones of the sentences around it, and the rules which look at the sentences before are turned
+        off by default, see CONTEXT_RULES.
+        :param sentences: list of sentences to be checked for errors
+        :param deadline: time.monotonic() by which the messages are needed, LanguageToolError is raised after it
+        :param owners: the text each of the sentences is from, sentences of different texts are never grouped. All of
+                       them are from the same text if None.
+        :return: list with the list of findings for each of the sentences, see format_findings
+        """
+        findings = [[] for _ in sentences]
+        separator = '\n\n'
+        group_size = -(-len(sentences) // self.tool.size)
+        alone = [PAIRED_SYMBOLS.search(s) is not None for s in sentences]
+
+        # the first sentence of each group, the joined text of the group and where each sentence starts in it
+        groups = []
+        start = 0
+        while start < len(sentences):
+            end = start
+            offsets = []
+            length = 0
+            while end < len(sentences) and end - start < group_size\
+                    and (end == start or length + len(sentences[end]) <= self.language_check_chars
+                         and not alone[start] and not alone[end]
+                         and (owners is None or owners[end] == owners[start])):
+                offsets.append(length)
+                length += len(sentences[end]) + len(separator)
+                end += 1
+            groups.append((start, separator.join(sentences[start:end]), offsets))
+            start = end
+
+        results = self.tool.check_many([text for _, text, _ in groups], deadline)
+        for (start, _, offsets), matches in zip(groups, results):
+            for match in matches:
+                position = bisect_right(offsets, match.offset) - 1
+                sentence = sentences[start + position]
+                # a match in the separator is of no sentence, one running into the next sentence is cut at the end
+                if match.offset - offsets[position] >= len(sentence):
+                    continue
+                for found in self.language_check_findings([match], offsets[position]):
+                    found['end'] = min(found['end'], len(sentence))
+                    findings[start + position].append(found)
+
+        return findings
+
+    def language_check_messages(self, matches):
+        """
+        The messages of the LanguageTool matches. The rules which aren't reported are turned off on LanguageTool, so
+        all of the matches are kept.
+        :param matches: the matches returned by LanguageTool
+        :return: list of messages
+        """
+        return [match.msg for match in matches]
+
+    def language_check_findings(self, matches, offset=0):
+        """
+        The LanguageTool matches as findings. LanguageTool's messages aren't templates, so they are kept as they are.
+        :param matches: the matches returned by LanguageTool
+        :param offset: where the sentence starts in the text LanguageTool checked
+        :return: list of findings, see format_findings
+        """
+        return [finding('LT_' + match.ruleId, match.offset - offset, match.offset - offset + match.errorlength,
+                        message=match.msg) for match in matches]
 
-    def etcetera_check(self, sentence):
+    def etcetera_check(self, sentence, tagged=None):
         """
         Method for usage of etcetera.
         :param sentence: sentence to be checked for errors
-        :return: None
-        """
-        pattern = '\s?[a-z]+\s?,[,|\s|.]*'
-        count = len(re.findall(pattern, sentence))
-        if count == 1\
-                and self.nlp(re.findall(pattern, sentence)[0].split(',')[0].strip('.'))[0].tag_ in ['NN', 'NNS', 'NNP', 'NNPS']\
-                and 'etc' not in sentence\
-                and 'and' not in sentence:
-            self.error_list.append("Should have used 'and' here.")
-
-        if count > 1\
-                and self.nlp(re.findall(pattern, sentence)[0].split(',')[0].strip('.'))[0].tag_ in ['NN', 'NNS', 'NNP', 'NNPS']\
-                and 'etc' not in sentence\
-                and 'and' not in sentence:
-            self.error_list.append('Should use "et cetera" between multiple nouns.')
+        :param tagged: the TaggedSentence of the sentence, it is tagged here if not given
+        :return: list of the errors found
+        """
+        return self.format_findings(self.etcetera_check_findings(sentence, tagged))
+
+    def etcetera_check_findings(self, sentence, tagged=None):
+        """
+        etcetera_check, giving back where the errors are
+        :return: list of findings, see format_findings
+        """
+        findings = []
+        pattern = '\s?([a-z]+)\s?,[,|\s|.]*'
+        matches = list(re.finditer(pattern, sentence))
+        count = len(matches)
+        if count == 0 or 'etc' in sentence or 'and' in sentence:
+            return findings
+
+        if tagged is None:
+            tagged = self.tag_sentence(sentence)
+
+        # pos tag of the first word followed by a comma
+        first_tag = tagged.tag_at(matches[0].start(1))
+        # from the first word followed by a comma to the last one
+        start, end = matches[0].start(1), matches[-1].end(1)
+
+        if count == 1 and first_tag in ['NN', 'NNS', 'NNP', 'NNPS']:
+            findings.append(finding('USE_AND', start, end))
+
+        if count > 1 and first_tag in ['NN', 'NNS', 'NNP', 'NNPS']:
+            findings.append(finding('USE_ETCETERA', start, end))
+
+        return findings
+
+    def message_templates(self):
+        """
+        The message templates of every error code, except LanguageTool's whose findings carry their message
+        :return: dictionary of code -> template, where {0}, {1}, ... are the args of a finding
+        """
+        templates = dict(MESSAGES)
+        templates.update(self.pronoun_rules.templates)
+        return templates
+
+    def format_findings(self, findings):
+        """
+        The messages of findings. A finding is a dictionary with the code of the error, its start and end character
+        offsets in the sentence and the args of the message template of the code, or the message itself for the
+        errors found by LanguageTool.
+        :param findings: list of findings
+        :return: list of messages
+        """
+        messages = []
+        for found in findings:
+            if 'message' in found:
+                messages.append(found['message'])
+            elif found['code'] in MESSAGES:
+                messages.append(MESSAGES[found['code']].format(*found['args']))
+            else:
+                messages.append(self.pronoun_rules.templates[found['code']].format(*found['args']))
+        return messages
+
+    def tag_sentence(self, sentence):
+        """
+        Tags the sentence once, so that all of the checks can share the tags
+        :param sentence: sentence to be tagged
+        :return: the TaggedSentence
+        """
+        return TaggedSentence(sentence, self.tagger.tag(sentence))
 
     def grammar_check(self, sentence):
         """
         Method to integrate all of the error detection functions and then retuning the error dictionary with keys
-         as the sentence and values as a list of all the errors found.
+         as the sentence and values as a list of all the errors found. Every sentence is parsed only once and the
+         tags are shared by all of the checks.
         :param sentence: sentence to be checked for errors
         :return: The error dictionary
         """
-        self.error_dic = dict()
-        sent = sent_tokenize(sentence)
-        for s in sent:
-            self.error_list = []
-            self.using_grammar_check(s)
-            sen = self.clean_sentence(s)
+        return self.grammar_check_many([sentence])[0]
+
+    def grammar_check_many(self, texts, batch_size=None):
+        """
+        Checks many texts together. The sentences of all the texts are tagged in batches and the
+        LanguageTool calls are grouped, which saves most of the per text overhead when there are a lot of short texts.
+        :param texts: list of texts to be checked for errors
+        :param batch_size: number of sentences tagged together, defaults to self.batch_size
+        :return: list of error dictionaries, one for each text in the same order as the texts
+        """
+        if batch_size is None:
+            batch_size = self.batch_size
+
+        # the sentences of all of the texts and the text each of them came from
+        sent = []
+        owners = []
+        with self.metrics.time('stage_seconds', 'stage', 'sent_tokenize'):
+            for index, text in enumerate(texts):
+                for s in sent_tokenize(text):
+                    sent.append(s)
+                    owners.append(index)
+
+        results = [dict() for _ in texts]
+        for index, s, errors in zip(owners, sent, self.check_sentences(sent, batch_size, owners=owners)):
+            results[index][s] = errors
+
+        return results
+
+    def grammar_check_stream(self, chunks, window=16, batch_size=None):
+        """
+        Checks a text which comes in chunks, giving back the errors of every sentence as soon as it is checked.
+        A sentence is only checked once the chunk after it has come, or the text has ended, so sentences cut between
+        two chunks are checked whole.
+        :param chunks: iterable of pieces of the text, in order
+        :param window: number of sentences checked together, smaller gives the first results sooner
+        :param batch_size: number of sentences tagged together, defaults to self.batch_size
+        :return: generator of dictionaries with the index, start and end offsets in the text, sentence and errors
+        """
+        if batch_size is None:
+            batch_size = self.batch_size
+
+        buffer = ''
+        consumed = 0  # offset of the start of the buffer in the whole text
+        index = 0
+        pending = []
+        ended = False
+        chunks = iter(chunks)
+
+        while not ended:
             try:
-                self.check_for_you(sen)
-                self.check_for_he(sen)
-                self.check_for_i(sen)
-                self.noun_capitalise(sen)
-                # self.end_with_punctuation(sen)
-                self.hyphen_space(sen)
+                buffer += next(chunks)
+                spans = split_sentences(buffer)
+                complete = spans[:-1]
+            except StopIteration:
+                ended = True
+                spans = split_sentences(buffer)
+                complete = spans
+
+            pending.extend((s, consumed + start, consumed + end) for s, start, end in complete)
+            if complete and not ended:
+                # the last sentence may not be complete yet, keep it for the next chunk
+                cut = spans[-1][1]
+                buffer = buffer[cut:]
+                consumed += cut
+
+            while pending and (len(pending) >= window or ended):
+                checking = pending[:window]
+                pending = pending[window:]
+                errors = self.check_sentences([s for s, _, _ in checking], batch_size)
+                for (s, start, end), sentence_errors in zip(checking, errors):
+                    yield {'index': index, 'start': start, 'end': end, 'sentence': s, 'errors': sentence_errors}
+                    index += 1
+
+    def check_sentences(self, sent, batch_size, compact=False, owners=None):
+        """
+        Runs all of the error detection functions over a list of sentences. Sentences found in the cache are not
+        checked again.
+        :param sent: list of sentences to be checked for errors
+        :param batch_size: number of sentences tagged together
+        :param compact: give back the findings instead of the messages
+        :param owners: the text each of the sentences is from, all of them are from the same text if None
+        :return: generator of the list of errors found for each sentence, in the order of the sentences
+        """
+        self.metrics.count('sentences_total', amount=len(sent))
+        if self.cache is None:
+            for findings in self.check_missing_sentences(sent, batch_size, owners):
+                yield findings if compact else self.format_findings(findings)
+            return
+
+        with self.metrics.time('stage_seconds', 'stage', 'cache'):
+            cached = [self.cache.get(s, self.rules_version) for s in sent]
+        missing = [index for index, found in enumerate(cached) if found is None]
+        checked = self.check_missing_sentences([sent[index] for index in missing], batch_size,
+                                               [owners[index] for index in missing] if owners is not None else None)
+        for s, findings in zip(sent, cached):
+            if findings is None:
+                findings = next(checked)
+                self.cache.put(s, self.rules_version, findings)
+            yield findings if compact else self.format_findings(findings)
+
+    def check_missing_sentences(self, sent, batch_size, owners=None):
+        """
+        Checks the sentences which aren't in the cache, in chunks on the pool of self.parallel when there are enough of
+        them and in this thread otherwise
+        :param sent: list of sentences to be checked for errors
+        :param batch_size: number of sentences tagged together
+        :param owners: the text each of the sentences is from, all of them are from the same text if None
+        :return: generator of the list of findings for each sentence, in the order of the sentences
+        """
+        if self.parallel is not None and self.parallel.wanted(sent):
+            self.metrics.count('parallel_sentences_total', amount=len(sent))
+            return self.parallel.check(sent, batch_size, owners)
+        return self.check_uncached_sentences(sent, batch_size, owners)
+
+    def check_uncached_sentences(self, sent, batch_size, owners=None):
+        """
+        Runs all of the error detection functions over a list of sentences
+        :param sent: list of sentences to be checked for errors
+        :param batch_size: number of sentences tagged together
+        :param owners: the text each of the sentences is from, all of them are from the same text if None
+        :return: generator of the list of findings for each sentence, in the order of the sentences
+        """
+        metrics = self.metrics
+        checks = self.sentence_checks()
+
+        with metrics.time('stage_seconds', 'stage', 'language_tool'):
+            language_check_findings = self.using_grammar_check_many(sent, owners=owners)
+        metrics.count('errors_total', 'check', 'language_tool', sum(len(found) for found in language_check_findings))
+        with metrics.time('stage_seconds', 'stage', 'clean_sentence'):
+            cleaned = [self.clean_sentence(s) for s in sent]
+        docs = self.tagger.tag_many(cleaned, batch_size)
+
+        for s, sen, findings in zip(sent, cleaned, language_check_findings):
+            try:
+                with metrics.time('stage_seconds', 'stage', 'tagging'):
+                    tagged = TaggedSentence(sen, next(docs))
+                for name, check in checks:
+                    findings.extend(map_findings(self.run_check(name, check, sen, tagged), sen, s))
 
             except Exception as e:
-                logging.error("{} - {}".format(s, str(e)))
-            logging.info("{} - {}".format(s,  ', '.join(self.error_list)))
-            self.error_dic[s] = self.error_list
+                logging.error("Check failed", extra={'sentence': s, 'error': str(e)})
+            sentence_log.info("Checked", extra={'sentence': s, 'errors': [found['code'] for found in findings]})
+            yield findings
 
-        return self.error_dic
+    def run_check(self, name, check, sentence, tagged):
+        """
+        Runs a single check on a sentence, recording how long it took and how many errors it found
+        :param name: name of the check
+        :param check: the check method
+        :param sentence: the cleaned sentence
+        :param tagged: the TaggedSentence of the sentence, None for the checks which don't need it
+        :return: list of the errors found
+        """
+        start = time.perf_counter()
+        found = check(sentence, tagged)
+        self.metrics.observe('check_seconds', 'check', name, time.perf_counter() - start)
+        if found:
+            self.metrics.count('errors_total', 'check', name, len(found))
+        return found
+
+    def grammar_check_budget(self, text, budget, batch_size=None):
+        """
+        Checks a text within a time budget, giving back whatever was found when the budget runs out. The checks which
+        don't need tags run first, then tagging and the tagged checks, and LanguageTool last, each of them only if
+        there is budget left. The errors of every sentence are in the same order as without a budget.
+        :param text: text to be checked for errors
+        :param budget: seconds the checks can take
+        :param batch_size: number of sentences tagged together, defaults to self.batch_size
+        :return: the error dictionary, and a dictionary with the names of the checks which ran and were skipped on
+                 every sentence
+        """
+        deadline = time.monotonic() + budget
+        if batch_size is None:
+            batch_size = self.batch_size
 
+        with self.metrics.time('stage_seconds', 'stage', 'sent_tokenize'):
+            sent = sent_tokenize(text)
 
-a = GrammarCheck()
+        suggestions = {}
+        checks = {}
+        for s, findings, ran in self.check_sentences_budget(sent, deadline, batch_size):
+            suggestions[s] = self.format_findings(findings)
+            checks[s] = {'ran': ran, 'skipped': [name for name in self.check_names() if name not in ran]}
+        return suggestions, checks
+
+    def grammar_check_compact(self, text, budget=None, batch_size=None):
+        """
+        Checks a text, giving back the errors as codes with their character offsets in the text instead of messages.
+        The messages are made from the templates of message_templates and the args of each error, except for the
+        errors of LanguageTool which keep their message. Sentences are given by their index, so sentences which are
+        in the text more than once are all there.
+        :param text: text to be checked for errors
+        :param budget: seconds the checks can take, see grammar_check_budget, no limit if None
+        :param batch_size: number of sentences tagged together, defaults to self.batch_size
+        :return: dictionary with the start and end offsets of every sentence, the list of errors with the code,
+                 sentence index, start and end offsets and args of each, and the names of the checks which were
+                 skipped on each sentence index if any were
+        """
+        if batch_size is None:
+            batch_size = self.batch_size
+
+        deadline = time.monotonic() + budget if budget is not None else None
+        with self.metrics.time('stage_seconds', 'stage', 'sent_tokenize'):
+            spans = split_sentences(text)
+        sent = [s for s, _, _ in spans]
+
+        if deadline is None:
+            checked = [(findings, None) for findings in self.check_sentences(sent, batch_size, compact=True)]
+        else:
+            checked = [(findings, ran) for _, findings, ran in self.check_sentences_budget(sent, deadline, batch_size)]
+
+        errors = []
+        skipped = {}
+        for index, ((_, start, _), (findings, ran)) in enumerate(zip(spans, checked)):
+            for found in findings:
+                error = {'code': found['code'], 'sentence': index,
+                         'start': start + found['start'], 'end': start + found['end']}
+                if found['args']:
+                    error['args'] = found['args']
+                if 'message' in found:
+                    error['message'] = found['message']
+                errors.append(error)
+            if ran is not None and len(ran) < len(self.check_names()):
+                skipped[index] = [name for name in self.check_names() if name not in ran]
+
+        result = {'sentences': [[start, end] for _, start, end in spans], 'errors': errors}
+        if deadline is not None:
+            result['skipped'] = skipped
+        return result
+
+    def check_names(self):
+        """
+        Names of all of the stages which report errors, in the order their errors are given back
+        :return: list of names
+        """
+        return ['language_tool'] + [name for name, _ in self.sentence_checks()]
+
+    def check_sentences_budget(self, sent, deadline, batch_size):
+        """
+        Runs the checks over a list of sentences, cheap checks first, until the deadline. Sentences found in the cache
+        are not checked again, and only the sentences every check ran on are put in the cache.
+        :param sent: list of sentences to be checked for errors
+        :param deadline: time.monotonic() after which no more checks are started
+        :param batch_size: number of sentences tagged together
+        :return: list of (sentence, findings, names of the checks which ran) in the order of the sentences
+        """
+        metrics = self.metrics
+        metrics.count('sentences_total', amount=len(sent))
+        names = self.check_names()
+        found = [None] * len(sent)  # check name -> findings, for every sentence not in the cache
+        results = [None] * len(sent)
+        if self.cache is not None:
+            with metrics.time('stage_seconds', 'stage', 'cache'):
+                results = [self.cache.get(s, self.rules_version) for s in sent]
+        todo = [index for index, findings in enumerate(results) if findings is None]
+
+        cheap = [(name, check) for name, check in self.sentence_checks() if name in CHEAP_CHECKS]
+        tagged_checks = [(name, check) for name, check in self.sentence_checks() if name not in CHEAP_CHECKS]
+
+        with metrics.time('stage_seconds', 'stage', 'clean_sentence'):
+            cleaned = {index: self.clean_sentence(sent[index]) for index in todo}
+        for index in todo:
+            found[index] = {}
+            try:
+                for name, check in cheap:
+                    found[index][name] = map_findings(self.run_check(name, check, cleaned[index], None),
+                                                      cleaned[index], sent[index])
+            except Exception as e:
+                logging.error("Check failed", extra={'sentence': sent[index], 'error': str(e)})
+
+        if tagged_checks:
+            # a big batch would be tagged whole on its first sentence, whatever the deadline
+            step = min(batch_size, BUDGET_BATCH_SIZE)
+            for first in range(0, len(todo), step):
+                if time.monotonic() >= deadline:
+                    break
+                part = todo[first:first + step]
+                try:
+                    with metrics.time('stage_seconds', 'stage', 'tagging'):
+                        docs = self.tagger.tag_many([cleaned[index] for index in part], step)
+                        tagged = [TaggedSentence(cleaned[index], doc) for index, doc in zip(part, docs)]
+                except Exception as e:
+                    logging.error("Tagging failed", extra={'sentences': [sent[index] for index in part],
+                                                           'error': str(e)})
+                    continue
+                for index, tagged_sentence in zip(part, tagged):
+                    if time.monotonic() >= deadline:
+                        break
+                    try:
+                        for name, check in tagged_checks:
+                            found[index][name] = map_findings(
+                                self.run_check(name, check, cleaned[index], tagged_sentence),
+                                cleaned[index], sent[index])
+                    except Exception as e:
+                        logging.error("Check failed", extra={'sentence': sent[index], 'error': str(e)})
+
+        if todo and time.monotonic() < deadline:
+            try:
+                with metrics.time('stage_seconds', 'stage', 'language_tool'):
+                    language_check_findings = self.using_grammar_check_many([sent[index] for index in todo], deadline)
+                metrics.count('errors_total', 'check', 'language_tool', sum(len(f) for f in language_check_findings))
+                for index, findings in zip(todo, language_check_findings):
+                    found[index]['language_tool'] = findings
+            except LanguageToolError as e:
+                logging.error("LanguageTool skipped - {}".format(str(e)))
+
+        checked = []
+        for index, s in enumerate(sent):
+            if found[index] is None:
+                checked.append((s, results[index], names))
+                continue
+            ran = [name for name in names if name in found[index]]
+            findings = [item for name in ran for item in found[index][name]]
+            if len(ran) == len(names) and self.cache is not None:
+                self.cache.put(s, self.rules_version, findings)
+            sentence_log.info("Checked", extra={'sentence': s, 'errors': [f['code'] for f in findings],
+                                                'skipped': len(names) - len(ran)})
+            checked.append((s, findings, ran))
+        return checked
+
+
+a = GrammarCheck(cache=SentenceCache())
+sessions = DocumentSessions(a, split_sentences)
 
 
 # Method to integrate all of the functions together.
@@ -469,9 +913,234 @@ def gram_check():
     content = request.json
     sentence = content['text']
 
-    suggestions = a.grammar_check(sentence)
+    budget = content['budget_ms'] / 1000.0 if content.get('budget_ms') is not None else None
+    response = {}
+    with a.metrics.breakdown() as timings:
+        if content.get('compact'):
+            response["response"] = a.grammar_check_compact(sentence, budget)
+            response["messages_version"] = a.rules_version
+        elif budget is not None:
+            response["response"], response["checks"] = a.grammar_check_budget(sentence, budget)
+        else:
+            response["response"] = a.grammar_check(sentence)
+    if content.get('timings'):
+        response["timings"] = timings
+    return jsonify(response)
+
+
+# Method to check many texts in one request.
+@app.route('/gramcheck/batch', methods=['POST'])
+def gram_check_batch():
+    content = request.json
+    texts = content['texts']
+
+    with a.metrics.breakdown() as timings:
+        suggestions = a.grammar_check_many(texts, content.get('batch_size'))
+    if content.get('timings'):
+        return jsonify({"response": suggestions, "timings": timings})
     return jsonify({"response": suggestions})
 
 
+# Method to check a long text, giving back one JSON line per sentence as soon as it is checked. The text can be posted
+# as JSON {"text": ...} or as a plain text body, which is read as it comes so chunked uploads are not buffered.
+@app.route('/gramcheck/stream', methods=['POST'])
+def gram_check_stream():
+    if request.is_json:
+        chunks = [request.json['text']]
+    else:
+        chunks = read_text_chunks(request.stream, request.mimetype_params.get('charset', 'utf-8'))
+
+    def generate():
+        for result in a.grammar_check_stream(chunks):
+            yield json.dumps(result) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+def read_text_chunks(stream, encoding, size=65536):
+    """
+    Reads a request body piece by piece
+    :param stream: the body stream
+    :param encoding: encoding of the text
+    :param size: number of bytes read at a time
+    :return: generator of decoded pieces of the text
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    while True:
+        data = stream.read(size)
+        if not data:
+            break
+        yield decoder.decode(data)
+    yield decoder.decode(b'', final=True)
+
+
+# Method for editors to check a document again after an edit. Only the sentences added or changed since the last text
+# posted for the same document id are checked.
+@app.route('/gramcheck/session/<doc_id>', methods=['POST'])
+def gram_check_session(doc_id):
+    content = request.json
+    text = content['text']
+
+    suggestions, checked = sessions.update(doc_id, text, content.get('batch_size'))
+    return jsonify({"response": suggestions, "checked": checked})
+
+
+# Method to forget a document once the editor closes it.
+@app.route('/gramcheck/session/<doc_id>', methods=['DELETE'])
+def gram_check_session_drop(doc_id):
+    return jsonify({"response": sessions.drop(doc_id)})
+
+
+# Method to export the counters and latency histograms for Prometheus.
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(a.metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+# Method to fetch the message templates of the error codes of compact responses, once per messages_version.
+@app.route('/gramcheck/messages', methods=['GET'])
+def gram_check_messages():
+    return jsonify({"response": a.message_templates(), "version": a.rules_version})
+
+
+# Method for orchestrators to find out whether the models are loaded, traffic should only be sent once it gives 200.
+@app.route('/ready', methods=['GET'])
+def ready():
+    if not a.ready.is_set():
+        return jsonify({"response": False}), 503
+    return jsonify({"response": True})
+
+
+# Method to look at the counters of the sentence cache.
+@app.route('/gramcheck/cache', methods=['GET'])
+def gram_check_cache():
+    if a.cache is None:
+        return jsonify({"response": None})
+    return jsonify({"response": a.cache.stats()})
+
+
+def split_list(value):
+    """
+    Splits a comma separated command line option
+    :param value: the option
+    :return: list of the values
+    """
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def make_parser():
+    """
+    The command line options of the API, shared with the other entry points like prefork_server.py
+    :return: the ArgumentParser
+    """
+    parser = argparse.ArgumentParser(description='Grammar check API')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--threaded', action='store_true',
+                        help='serve requests concurrently, each one on its own thread sharing the loaded models')
+    parser.add_argument('--language-tool-pool', type=int, default=4,
+                        help='number of LanguageTool instances sentences are checked on at the same time')
+    parser.add_argument('--language-tool-timeout', type=float, default=60,
+                        help='seconds to wait for LanguageTool on a group of sentences')
+    parser.add_argument('--language-tool-url', default=None,
+                        help='url of a LanguageTool server that is already running, instead of starting one')
+    parser.add_argument('--disable-rules', default=','.join(DISABLED_RULES + CONTEXT_RULES),
+                        help='comma separated ids of the LanguageTool rules to turn off')
+    parser.add_argument('--enable-rules', default='', help='comma separated ids of LanguageTool rules to turn on')
+    parser.add_argument('--disable-categories', default='', help='comma separated LanguageTool categories to drop')
+    parser.add_argument('--enable-categories', default='', help='comma separated LanguageTool categories to keep')
+    parser.add_argument('--max-sessions', type=int, default=1000,
+                        help='number of documents whose sentences are kept for incremental checking')
+    parser.add_argument('--cache-entries', type=int, default=10000,
+                        help='number of sentences whose results are cached, 0 turns the cache off')
+    parser.add_argument('--cache-bytes', type=int, default=None, help='maximum size of the cached results in UTF-8 bytes')
+    parser.add_argument('--cache-path', default=None, help='SQLite file the cache is kept in across restarts')
+    parser.add_argument('--cache-file-entries', type=int, default=1000000,
+                        help='number of sentences kept in the SQLite file, the least recently used are removed')
+    parser.add_argument('--cache-max-age', type=float, default=30 * 24 * 3600,
+                        help='seconds after its last use a sentence is removed from the SQLite file')
+    parser.add_argument('--tagger', choices=['spacy', 'nltk', 'lookup'], default='spacy',
+                        help="tagger of the checks: spaCy's, NLTK's perceptron, or a word to tag table which is the "
+                             "fastest and least accurate one")
+    parser.add_argument('--tagger-table', default=None,
+                        help='JSON table of the lookup tagger made by benchmark_taggers.py --build-table, the built in '
+                             'closed class words if not given')
+    parser.add_argument('--parallel-processes', type=int, default=0,
+                        help='split long documents over this many processes, 0 checks every document in its request')
+    parser.add_argument('--parallel-threshold', type=int, default=128,
+                        help='number of sentences from which a document is split over the processes')
+    parser.add_argument('--parallel-chunk', type=int, default=32, help='sentences checked together by a process')
+    parser.add_argument('--no-warm-up', action='store_true',
+                        help="load the models on the first request instead of in the background at startup")
+    parser.add_argument('--log-file', default='log_file.log',
+                        help='file the JSON log lines are written to, {pid} in it is replaced by the process id. '
+                             'Forked processes send their lines to the process which started them')
+    parser.add_argument('--log-level', default='INFO', help='lowest level logged, like DEBUG, INFO or ERROR')
+    parser.add_argument('--log-max-bytes', type=int, default=10 * 1024 * 1024,
+                        help='size at which the log file is rotated, 0 never rotates it')
+    parser.add_argument('--log-backups', type=int, default=5, help='number of rotated log files kept')
+    parser.add_argument('--log-sample', type=float, default=1.0,
+                        help='fraction of the per sentence log lines written, errors are always written')
+    return parser
+
+
+def configure_logging(args):
+    """
+    Sets up the logging of the process from the command line options
+    :param args: the parsed command line options
+    """
+    setup_logging(args.log_file, args.log_level.upper(), args.log_max_bytes, args.log_backups, args.log_sample)
+
+
+def configure(args):
+    """
+    Sets up the logging, the module level checker and the sessions from the command line options, except for the cache
+    :param args: the parsed command line options
+    """
+    configure_logging(args)
+
+    factory = None
+    if args.language_tool_url is not None:
+        factory = functools.partial(RemoteLanguageTool, args.language_tool_url, 'en-US')
+    a.tool = LanguageToolPool(size=args.language_tool_pool, timeout=args.language_tool_timeout, factory=factory,
+                              disabled_rules=split_list(args.disable_rules), enabled_rules=split_list(args.enable_rules),
+                              disabled_categories=split_list(args.disable_categories),
+                              enabled_categories=split_list(args.enable_categories))
+    a.tagger = make_tagger(args.tagger, args.tagger_table, a.metrics)
+    a.rules_version = a.get_rules_version()
+    if a.parallel is not None:
+        a.parallel.close()
+    a.parallel = None
+    if args.parallel_processes > 0:
+        a.parallel = ParallelChecker(args.parallel_processes, args.parallel_threshold, args.parallel_chunk)
+    sessions.max_sessions = args.max_sessions
+
+
+def make_cache(args):
+    """
+    Makes the sentence cache from the command line options. The SQLite connection can't be shared with a forked
+    process, so a pre-forked worker makes its own.
+    :param args: the parsed command line options
+    :return: the SentenceCache, or None if the cache is turned off
+    """
+    if args.cache_entries <= 0:
+        return None
+    return SentenceCache(max_entries=args.cache_entries, max_bytes=args.cache_bytes, path=args.cache_path,
+                         file_entries=args.cache_file_entries, max_age=args.cache_max_age)
+
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000)
+    args = make_parser().parse_args()
+    configure(args)
+    a.cache = make_cache(args)
+
+    # the pool is forked from the warmed up checker before the server has started any threads
+    if a.parallel is not None:
+        a.parallel.start(a)
+    # the server answers right away, /ready gives 503 until the models are loaded
+    elif args.no_warm_up:
+        a.ready.set()
+    else:
+        threading.Thread(target=a.warm_up, name='warm-up', daemon=True).start()
+
+    app.run(host=args.host, port=args.port, threaded=args.threaded)
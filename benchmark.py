@@ -0,0 +1,279 @@
+# Feature: Benchmark suite
+# Measures the throughput and latency of the grammar check on synthetic corpora, with LanguageTool replaced by a stub
+# so it runs offline and measures our own code apart from LanguageTool. The results are saved as JSON, so two commits
+# can be compared with `python benchmark.py compare old.json new.json`.
+
+import argparse
+import functools
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fake_languagetool import FakeLanguageTool
+from grammar_module import load_grammar_module
+from language_tool_pool import CONTEXT_RULES, DISABLED_RULES, LanguageToolPool, RemoteLanguageTool
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+PRONOUNS = {'i': ['I'], 'he': ['He', 'She', 'It', 'Customer'], 'you': ['You', 'They', 'We'], 'none': ['The team', 'John']}
+FOLLOWERS = {'I': ['am', 'have', 'had', 'would', 'was', 'going', 'been', 'play', 'have been'],
+             'He': ['is', 'has', 'had', 'would', 'was', 'playing', 'been', 'plays', 'would have been'],
+             'You': ['are', 'have', 'had', 'would', 'were', 'singing', 'been', 'sing', 'have been']}
+WORDS = ['playing', 'gone', 'the', 'market', 'a', 'happy', 'boy', 'to', 'paris', 'told', 'very', 'quickly', 'report',
+         'apples', 'oranges', 'with', 'friends', 'best', 'player', 'well-known', 'not', 'an', 'hour', 'dog', 'london']
+
+
+def make_sentence(rng, words, mix):
+    """
+    Makes a random sentence
+    :param rng: the random number generator
+    :param words: number of words in the sentence
+    :param mix: which pronouns the sentence can start with, one of the keys of PRONOUNS or 'mixed'
+    :return: the sentence
+    """
+    group = rng.choice(list(PRONOUNS)) if mix == 'mixed' else mix
+    subject = rng.choice(PRONOUNS[group])
+    base = 'He' if group == 'he' else 'You' if group == 'you' else 'I'
+    sentence = [subject] + rng.choice(FOLLOWERS[base]).split()
+    while len(sentence) < words:
+        sentence.append(rng.choice(WORDS))
+    ending = rng.choice(['.', '.', '.', '!', '?', ''])
+    return ' '.join(sentence[:max(words, 2)]) + ending
+
+
+def make_corpus(sentences, words, mix, per_document, seed=0):
+    """
+    Makes a corpus of documents
+    :param sentences: number of sentences in the corpus
+    :param words: number of words in each sentence
+    :param mix: which pronouns the sentences start with
+    :param per_document: number of sentences in each document
+    :param seed: seed of the random number generator, the same seed gives the same corpus
+    :return: list of documents
+    """
+    rng = random.Random(seed)
+    made = [make_sentence(rng, words, mix) for _ in range(sentences)]
+    return [' '.join(made[i:i + per_document]) for i in range(0, len(made), per_document)]
+
+
+def summarize(latencies, sentences, elapsed):
+    """
+    :param latencies: seconds taken by every call
+    :param sentences: number of sentences checked by all of the calls
+    :param elapsed: wall clock seconds of all of the calls
+    :return: dictionary with the throughput, latency percentiles and peak memory so far
+    """
+    latencies = sorted(latencies)
+    return {'calls': len(latencies), 'sentences': sentences,
+            'sentences_per_sec': sentences / elapsed if elapsed else 0.0,
+            'p50_ms': latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+            'p99_ms': latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)] * 1000 if latencies else 0.0,
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0}
+
+
+def timed(function, items):
+    """
+    Calls the function on every item one after the other
+    :return: list of seconds per call and the wall clock seconds
+    """
+    latencies = []
+    begin = time.perf_counter()
+    for item in items:
+        start = time.perf_counter()
+        function(item)
+        latencies.append(time.perf_counter() - start)
+    return latencies, time.perf_counter() - begin
+
+
+def bench_grammar_check(module, checker, documents):
+    """
+    Measures grammar_check on one document at a time
+    :return: the results of grammar_check
+    """
+    sentences = sum(len(module.sent_tokenize(document)) for document in documents)
+    latencies, elapsed = timed(checker.grammar_check, documents)
+    return summarize(latencies, sentences, elapsed)
+
+
+def bench_checks(module, checker, documents):
+    """
+    Measures every check on its own, on sentences which are cleaned and tagged up front
+    :return: dictionary of results per check
+    """
+    sentences = [checker.clean_sentence(s) for document in documents for s in module.sent_tokenize(document)]
+    tagged = [module.TaggedSentence(s, doc) for s, doc in zip(sentences, checker.tagger.tag_many(sentences))]
+    pairs = list(zip(sentences, tagged))
+
+    results = {}
+    for name in ['check_for_i', 'check_for_he', 'check_for_you', 'check_pronouns', 'noun_capitalise',
+                 'etcetera_check', 'hyphen_space', 'clean_sentence']:
+        method = getattr(checker, name)
+        if name == 'clean_sentence':
+            latencies, elapsed = timed(method, sentences)
+        else:
+            latencies, elapsed = timed(lambda pair: method(*pair), pairs)
+        results[name] = summarize(latencies, len(pairs), elapsed)
+
+    latencies, elapsed = timed(checker.tag_sentence, sentences)
+    results['tag_sentence'] = summarize(latencies, len(sentences), elapsed)
+    return results
+
+
+def bench_route(module, documents, concurrency):
+    """
+    Posts the documents to /gramcheck/ from concurrency threads at a time
+    :return: the results of the route
+    """
+    sentences = sum(len(module.sent_tokenize(document)) for document in documents)
+
+    def post(document):
+        client = module.app.test_client()
+        start = time.perf_counter()
+        response = client.post('/gramcheck/', json={'text': document})
+        assert response.status_code == 200, response.status_code
+        return time.perf_counter() - start
+
+    begin = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(post, documents))
+    return summarize(latencies, sentences, time.perf_counter() - begin)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=HERE, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def make_tool(args):
+    """
+    The LanguageTool the benchmark runs with
+    :param args: the command line options
+    :return: the LanguageToolPool
+    """
+    if args.language_tool == 'stub':
+        factory = functools.partial(FakeLanguageTool, 'en-US', args.stub_delay)
+    elif args.language_tool == 'real':
+        factory = None
+    else:
+        factory = functools.partial(RemoteLanguageTool, args.language_tool, 'en-US')
+    return LanguageToolPool(size=args.language_tool_pool, factory=factory,
+                            disabled_rules=DISABLED_RULES + CONTEXT_RULES)
+
+
+def run(args):
+    module = load_grammar_module()
+    checker = module.a
+    checker.tool = make_tool(args)
+    checker.cache = None
+    checker.rules_version = checker.get_rules_version()
+
+    report = {'commit': git_commit(), 'python': platform.python_version(), 'time': time.time(),
+              'config': vars(args), 'corpora': []}
+
+    for sentences in args.sizes:
+        for words in args.lengths:
+            for mix in args.mixes:
+                documents = make_corpus(sentences, words, mix, args.per_document, args.seed)
+                name = '{}x{}w-{}'.format(sentences, words, mix)
+                print('corpus {}'.format(name), file=sys.stderr)
+
+                # the first call loads the rules and warms up spaCy, which shouldn't be counted
+                checker.grammar_check(documents[0])
+                result = {'name': name, 'sentences': sentences, 'words': words, 'mix': mix,
+                          'grammar_check': bench_grammar_check(module, checker, documents),
+                          'checks': bench_checks(module, checker, documents)}
+                if not args.skip_route:
+                    result['route'] = bench_route(module, documents, args.concurrency)
+                report['corpora'].append(result)
+
+    report['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    print_report(report)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+def rows(report):
+    """
+    Flattens a report into (corpus, target) -> result
+    """
+    found = {}
+    for corpus in report['corpora']:
+        found[(corpus['name'], 'grammar_check')] = corpus['grammar_check']
+        for name, result in corpus['checks'].items():
+            found[(corpus['name'], name)] = result
+        if 'route' in corpus:
+            found[(corpus['name'], 'route')] = corpus['route']
+    return found
+
+
+def print_report(report):
+    print('{:<24}{:<18}{:>14}{:>10}{:>10}'.format('corpus', 'target', 'sentences/s', 'p50 ms', 'p99 ms'))
+    for (corpus, target), result in rows(report).items():
+        print('{:<24}{:<18}{:>14.1f}{:>10.3f}{:>10.3f}'.format(corpus, target, result['sentences_per_sec'],
+                                                               result['p50_ms'], result['p99_ms']))
+    print('peak rss {:.1f} MB'.format(report['peak_rss_mb']))
+
+
+def compare(args):
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    print('{} -> {}'.format(old.get('commit'), new.get('commit')))
+    print('{:<24}{:<18}{:>14}{:>14}{:>10}{:>10}'.format('corpus', 'target', 'old sent/s', 'new sent/s', 'speedup',
+                                                         'p99 x'))
+    old_rows = rows(old)
+    for key, result in rows(new).items():
+        if key not in old_rows:
+            continue
+        before = old_rows[key]
+        speedup = result['sentences_per_sec'] / before['sentences_per_sec'] if before['sentences_per_sec'] else 0.0
+        p99 = result['p99_ms'] / before['p99_ms'] if before['p99_ms'] else 0.0
+        print('{:<24}{:<18}{:>14.1f}{:>14.1f}{:>10.2f}{:>10.2f}'.format(key[0], key[1], before['sentences_per_sec'],
+                                                                       result['sentences_per_sec'], speedup, p99))
+    print('peak rss {:.1f} MB -> {:.1f} MB'.format(old['peak_rss_mb'], new['peak_rss_mb']))
+
+
+def int_list(value):
+    return [int(item) for item in value.split(',')]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Grammar check benchmarks')
+    commands = parser.add_subparsers(dest='command')
+
+    run_parser = commands.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument('--sizes', type=int_list, default=[200], help='comma separated numbers of sentences')
+    run_parser.add_argument('--lengths', type=int_list, default=[6, 20], help='comma separated words per sentence')
+    run_parser.add_argument('--mixes', type=lambda value: value.split(','), default=['mixed'],
+                            help="comma separated pronoun mixes: mixed, i, he, you, none")
+    run_parser.add_argument('--per-document', type=int, default=5, help='sentences per document')
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--language-tool', default='stub',
+                            help="'stub' for the in process fake, 'real' for language_check, or the url of a server")
+    run_parser.add_argument('--stub-delay', type=float, default=0.0, help='seconds every stub LanguageTool call sleeps')
+    run_parser.add_argument('--language-tool-pool', type=int, default=4)
+    run_parser.add_argument('--concurrency', type=int, default=4, help='threads posting to the route at a time')
+    run_parser.add_argument('--skip-route', action='store_true', help="don't benchmark the /gramcheck/ route")
+    run_parser.add_argument('--output', default=None, help='file the results are written to as JSON')
+
+    compare_parser = commands.add_parser('compare', help='compare two saved results')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+
+    args = parser.parse_args()
+    if args.command == 'compare':
+        compare(args)
+    elif args.command == 'run':
+        run(args)
+    else:
+        parser.print_help()
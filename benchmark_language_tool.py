@@ -0,0 +1,98 @@
+# Feature: LanguageTool rule benchmark
+# Measures how long LanguageTool takes per sentence with the unreported rules turned off on LanguageTool, against
+# running every rule and dropping the unreported messages afterwards.
+
+import argparse
+import json
+import statistics
+import time
+from language_tool_pool import DISABLED_RULES, RemoteLanguageTool
+
+SENTENCES = [
+    'I going to the market tomorrow with my freinds.',
+    'He have been working here since three years.',
+    'You would have been told about the the meeting.',
+    'She is best player in the team.',
+    'They was playing football when it started raining.',
+    'I have eaten an apple, a banana, a orange.',
+    'The customer has been waiting for an hour  now.',
+    'We should of known better than to trust him.',
+    'It is a well-known fact that smoking is harmful.',
+    'He would not have gone there if he knew the truth.',
+]
+
+
+def make_tool(args, disabled):
+    """
+    Makes the LanguageTool to be measured
+    :param args: the command line options
+    :param disabled: ids of the rules to turn off
+    :return: the LanguageTool
+    """
+    if args.fake:
+        from fake_languagetool import FakeLanguageTool
+        tool = FakeLanguageTool(delay=args.fake_delay)
+    elif args.url is not None:
+        tool = RemoteLanguageTool(args.url)
+    else:
+        import language_check
+        tool = language_check.LanguageTool('en-US')
+    tool.disabled.update(disabled)
+    return tool
+
+
+def measure(tool, sentences, repeat, drop_rules=()):
+    """
+    Checks every sentence repeat times, one after the other
+    :param tool: the LanguageTool
+    :param sentences: list of sentences
+    :param repeat: number of times each sentence is checked
+    :param drop_rules: ids of the rules whose matches are dropped after the check
+    :return: dictionary with the latencies per sentence in milliseconds and the number of matches kept
+    """
+    # the first check loads the rules on the LanguageTool server, which shouldn't be counted
+    tool.check(sentences[0])
+
+    latencies = []
+    kept = 0
+    for _ in range(repeat):
+        for sentence in sentences:
+            start = time.perf_counter()
+            matches = tool.check(sentence)
+            kept += len([match for match in matches if match.ruleId not in drop_rules])
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    latencies.sort()
+    return {'sentences': len(latencies), 'mean_ms': statistics.mean(latencies),
+            'p50_ms': latencies[len(latencies) // 2],
+            'p99_ms': latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)],
+            'matches_kept': kept}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='LanguageTool latency per sentence with and without the unreported rules')
+    parser.add_argument('--corpus', default=None, help='file with one sentence per line, a built in set if not given')
+    parser.add_argument('--repeat', type=int, default=20, help='number of times each sentence is checked')
+    parser.add_argument('--url', default=None, help='url of a LanguageTool server that is already running')
+    parser.add_argument('--fake', action='store_true', help='measure fake_languagetool.FakeLanguageTool instead')
+    parser.add_argument('--fake-delay', type=float, default=0.0, help='seconds every fake check sleeps')
+    parser.add_argument('--output', default=None, help='file the results are written to as JSON')
+    args = parser.parse_args()
+
+    sentences = SENTENCES
+    if args.corpus is not None:
+        with open(args.corpus, encoding='utf-8') as f:
+            sentences = [line.strip() for line in f if line.strip()]
+
+    results = {
+        'all rules, dropped after': measure(make_tool(args, []), sentences, args.repeat, DISABLED_RULES),
+        'rules turned off': measure(make_tool(args, DISABLED_RULES), sentences, args.repeat),
+    }
+
+    print('{:<28}{:>12}{:>12}{:>12}{:>10}'.format('', 'mean ms', 'p50 ms', 'p99 ms', 'matches'))
+    for name, result in results.items():
+        print('{:<28}{:>12.2f}{:>12.2f}{:>12.2f}{:>10}'.format(name, result['mean_ms'], result['p50_ms'],
+                                                               result['p99_ms'], result['matches_kept']))
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,101 @@
+# Feature: Tagger benchmark
+# Measures how fast every tagger tags a fixed corpus, and how many of the errors the tagged checks find with it are
+# the same as with spaCy, so a faster tagger can be picked for bulk jobs knowing what it costs in accuracy.
+
+import argparse
+import json
+import time
+from benchmark import make_corpus
+from grammar_module import load_grammar_module
+from taggers import LookupTagger, NltkTagger, SpacyTagger
+
+# the checks which read the tags, the findings of the others are the same with every tagger and would only make the
+# taggers look like they agree more
+TAGGED_CHECKS = ('check_pronouns', 'noun_capitalise')
+
+
+def load_sentences(module, checker, args):
+    """
+    The cleaned sentences of the corpus file, or of the synthetic corpus of benchmark.py with the seed
+    """
+    if args.corpus is not None:
+        with open(args.corpus, encoding='utf-8') as f:
+            documents = [line.strip() for line in f if line.strip()]
+    else:
+        documents = make_corpus(args.sentences, args.words, 'mixed', 5, args.seed)
+    return [checker.clean_sentence(s) for document in documents for s in module.sent_tokenize(document)]
+
+
+def findings_of(module, checker, tagger, sentences):
+    """
+    Tags the sentences and runs the checks which read the tags on them
+    :return: the seconds taken by the tagging and the set of (sentence index, code, start, end) found
+    """
+    start = time.perf_counter()
+    docs = list(tagger.tag_many(sentences, checker.batch_size))
+    elapsed = time.perf_counter() - start
+
+    found = set()
+    for index, (sentence, doc) in enumerate(zip(sentences, docs)):
+        tagged = module.TaggedSentence(sentence, doc)
+        for name, check in checker.sentence_checks():
+            if name not in TAGGED_CHECKS:
+                continue
+            for item in check(sentence, tagged):
+                found.add((index, item['code'], item['start'], item['end']))
+    return elapsed, found
+
+
+def measure(module, checker, taggers, sentences):
+    """
+    :param taggers: dictionary of name -> tagger, the first one is the reference the others are compared with
+    :return: dictionary of name -> results
+    """
+    results = {}
+    reference = None
+    for name, tagger in taggers.items():
+        # the first call loads the model, which shouldn't be counted
+        tagger.warm_up()
+        elapsed, found = findings_of(module, checker, tagger, sentences)
+        if reference is None:
+            reference = found
+        same = len(found & reference)
+        results[name] = {'sentences': len(sentences), 'sentences_per_sec': len(sentences) / elapsed if elapsed else 0.0,
+                         'errors': len(found), 'same': same,
+                         'precision': same / len(found) if found else 1.0,
+                         'recall': same / len(reference) if reference else 1.0}
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Throughput of the taggers and agreement of their errors with spaCy')
+    parser.add_argument('--corpus', default=None, help='file with one text per line, a synthetic corpus if not given')
+    parser.add_argument('--sentences', type=int, default=2000, help='sentences in the synthetic corpus')
+    parser.add_argument('--words', type=int, default=12, help='words per sentence in the synthetic corpus')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--table', default=None, help='JSON table of the lookup tagger, the built in one if not given')
+    parser.add_argument('--build-table', default=None,
+                        help='tag the corpus with spaCy and save the most common tag of every word to this JSON file')
+    parser.add_argument('--min-count', type=int, default=2, help='times a word is seen to be put in the built table')
+    parser.add_argument('--output', default=None, help='file the results are written to as JSON')
+    args = parser.parse_args()
+
+    module = load_grammar_module()
+    checker = module.a
+    sentences = load_sentences(module, checker, args)
+
+    spacy_tagger = SpacyTagger()
+    if args.build_table is not None:
+        LookupTagger.build(spacy_tagger, sentences, args.min_count).save(args.build_table)
+        args.table = args.build_table
+
+    results = measure(module, checker, {'spacy': spacy_tagger, 'nltk': NltkTagger(),
+                                        'lookup': LookupTagger(path=args.table)}, sentences)
+
+    print('{:<10}{:>14}{:>10}{:>12}{:>10}'.format('tagger', 'sentences/s', 'errors', 'precision', 'recall'))
+    for name, result in results.items():
+        print('{:<10}{:>14.1f}{:>10}{:>12.3f}{:>10.3f}'.format(name, result['sentences_per_sec'], result['errors'],
+                                                               result['precision'], result['recall']))
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,158 @@
+# Feature: Bulk checking of large corpora
+# Checks text files with one text per line on a pool of processes, each with its own GrammarCheck, and writes one JSON
+# line per input line in the same order. The files are read line by line and never loaded whole, and a checkpoint file
+# lets an interrupted run carry on where it stopped.
+
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from grammar_module import load_grammar_module
+
+# the GrammarCheck of a pool process, made by init_worker
+checker = None
+
+
+def init_worker(args):
+    """
+    Sets up the GrammarCheck of a pool process
+    :param args: the parsed command line options
+    """
+    global checker
+    module = load_grammar_module()
+    module.configure(args)
+    # the files are already split over the processes, which can't have a pool of their own
+    module.a.parallel = None
+    module.a.cache = module.make_cache(args)
+    checker = module.a
+
+
+def check_chunk(chunk):
+    """
+    Checks a chunk of lines in a pool process
+    :param chunk: (file index, first line number, offset after the chunk in the file, list of texts)
+    :return: (file index, line number after the chunk, offset after the chunk, JSON lines, number of sentences)
+    """
+    file_index, first_line, end_offset, texts = chunk
+    results = checker.grammar_check_many(texts)
+    lines = [json.dumps({'file': file_index, 'line': first_line + i, 'response': result}) + '\n'
+             for i, result in enumerate(results)]
+    return file_index, first_line + len(texts), end_offset, lines, sum(len(result) for result in results)
+
+
+def read_chunks(paths, chunk_lines, start=None):
+    """
+    Reads the input files line by line and groups the lines into chunks
+    :param paths: paths of the input files
+    :param chunk_lines: number of lines in a chunk
+    :param start: checkpoint to carry on from, the start of the first file if None
+    :return: generator of (file index, first line number, offset after the chunk, list of texts)
+    """
+    first_file = start['file'] if start is not None else 0
+    for file_index in range(first_file, len(paths)):
+        offset = 0
+        line = 0
+        if start is not None and file_index == first_file:
+            offset = start['offset']
+            line = start['line']
+
+        with open(paths[file_index], 'rb') as f:
+            f.seek(offset)
+            texts = []
+            for raw in f:
+                offset += len(raw)
+                texts.append(raw.decode('utf-8', errors='replace').rstrip('\r\n'))
+                if len(texts) == chunk_lines:
+                    yield file_index, line, offset, texts
+                    line += len(texts)
+                    texts = []
+            if texts:
+                yield file_index, line, offset, texts
+
+
+def load_checkpoint(path):
+    if path is None or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, checkpoint):
+    # written to a temporary file and renamed, so an interruption never leaves half a checkpoint
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def run(args):
+    checkpoint_path = args.checkpoint if args.checkpoint is not None else args.output + '.checkpoint'
+    start = load_checkpoint(checkpoint_path) if args.resume else None
+    if start is not None and start['inputs'] != args.inputs:
+        raise SystemExit('The checkpoint {} is of other input files: {}'.format(checkpoint_path, start['inputs']))
+
+    if start is not None:
+        # whatever was written after the last checkpoint is written again
+        output = open(args.output, 'r+b')
+        output.truncate(start['output'])
+        output.seek(start['output'])
+    else:
+        output = open(args.output, 'wb')
+
+    processes = args.processes or os.cpu_count() or 1
+    sentences = 0
+    chunks_done = 0
+    begin = time.perf_counter()
+    # the pool processes send their log records to this process, through a queue they get by being forked
+    load_grammar_module().configure_logging(args)
+    pool = multiprocessing.get_context('fork').Pool(processes, initializer=init_worker, initargs=(args,))
+    try:
+        # a few chunks per process are in flight at a time, so the input is never read much ahead of the output
+        pending = deque()
+        chunks = read_chunks(args.inputs, args.chunk_lines, start)
+        while True:
+            while len(pending) < processes * 4:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                pending.append(pool.apply_async(check_chunk, (chunk,)))
+            if not pending:
+                break
+
+            file_index, line, offset, lines, count = pending.popleft().get()
+            output.write(''.join(lines).encode('utf-8'))
+            sentences += count
+            chunks_done += 1
+
+            if chunks_done % args.checkpoint_every == 0 or not pending:
+                output.flush()
+                os.fsync(output.fileno())
+                save_checkpoint(checkpoint_path, {'inputs': args.inputs, 'file': file_index, 'line': line,
+                                                  'offset': offset, 'output': output.tell()})
+            if chunks_done % 100 == 0:
+                elapsed = time.perf_counter() - begin
+                print('{} sentences, {:.1f} sentences/s'.format(sentences, sentences / elapsed), file=sys.stderr)
+    finally:
+        pool.terminate()
+        output.close()
+
+    elapsed = time.perf_counter() - begin
+    print('Checked {} sentences in {:.1f} seconds, {:.1f} sentences/s'.format(
+        sentences, elapsed, sentences / elapsed if elapsed else 0.0), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    parser = load_grammar_module().make_parser()
+    parser.description = 'Checks text files with one text per line, writing one JSON line per input line'
+    parser.add_argument('inputs', nargs='+', help='text files with one text per line')
+    parser.add_argument('--output', required=True, help='JSONL file the results are written to')
+    parser.add_argument('--processes', type=int, default=None, help='number of processes, one per core if not given')
+    parser.add_argument('--chunk-lines', type=int, default=64, help='lines checked together by a process')
+    parser.add_argument('--checkpoint', default=None, help='checkpoint file, the output file with .checkpoint if not given')
+    parser.add_argument('--checkpoint-every', type=int, default=16, help='chunks written between checkpoints')
+    parser.add_argument('--resume', action='store_true', help='carry on from the checkpoint of an interrupted run')
+    run(parser.parse_args())
@@ -0,0 +1,125 @@
+# Feature: Incremental checking of documents
+# Keeps the sentences of a document and their errors between requests, so that an editor sending the whole document
+# again only has the sentences which were added or changed checked
+
+import threading
+from collections import OrderedDict
+from difflib import SequenceMatcher
+
+
+class DocumentSession:
+    """
+    The last seen sentences of a document with their offsets and errors.
+    """
+
+    def __init__(self):
+        self.sentences = []  # list of (sentence, start, end, errors)
+        self.rules_version = None
+        self.lock = threading.Lock()
+
+
+class DocumentSessions:
+    """
+    Sessions of the documents being edited, keyed on a document id. The least recently used sessions are dropped once
+    there are more than max_sessions of them.
+    """
+
+    def __init__(self, checker, split, max_sessions=1000):
+        """
+        :param checker: the GrammarCheck the sentences are checked with
+        :param split: function splitting a text into a list of (sentence, start, end)
+        :param max_sessions: maximum number of documents kept
+        """
+        self.checker = checker
+        self.split = split
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, doc_id):
+        """
+        Finds the session of a document, making a new one if there isn't any
+        :param doc_id: id of the document
+        :return: the DocumentSession
+        """
+        with self._lock:
+            session = self._sessions.get(doc_id)
+            if session is None:
+                session = self._sessions[doc_id] = DocumentSession()
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(doc_id)
+            return session
+
+    def drop(self, doc_id):
+        """
+        Forgets a document
+        :param doc_id: id of the document
+        :return: True if there was a session for the document
+        """
+        with self._lock:
+            return self._sessions.pop(doc_id, None) is not None
+
+    def update(self, doc_id, text, batch_size=None):
+        """
+        Checks the new text of a document. The sentences are compared with the ones of the last text of the document
+        and only the ones which were added or changed are checked, the others keep their errors at their new offsets.
+        :param doc_id: id of the document
+        :param text: the whole new text of the document
+        :param batch_size: number of sentences tagged together, defaults to the batch size of the checker
+        :return: list of dictionaries with the index, start and end offsets, sentence and errors of every sentence,
+                 and the number of sentences which were checked
+        """
+        if batch_size is None:
+            batch_size = self.checker.batch_size
+
+        session = self.get(doc_id)
+        with session.lock:
+            new = self.split(text)
+            errors = [None] * len(new)
+
+            # results of older rules can't be used again
+            old = session.sentences if session.rules_version == self.checker.rules_version else []
+            for old_index, new_index in self.unchanged(old, new):
+                errors[new_index] = old[old_index][3]
+
+            changed = [index for index, found in enumerate(errors) if found is None]
+            checked = self.checker.check_sentences([new[index][0] for index in changed], batch_size)
+            for index, found in zip(changed, checked):
+                errors[index] = found
+
+            session.sentences = [(s, start, end, found) for (s, start, end), found in zip(new, errors)]
+            session.rules_version = self.checker.rules_version
+
+            # made under the lock, so a concurrent update of the same document can't swap its sentences in
+            results = [{'index': index, 'start': start, 'end': end, 'sentence': s, 'errors': found}
+                       for index, (s, start, end, found) in enumerate(session.sentences)]
+            return results, len(changed)
+
+    @staticmethod
+    def unchanged(old, new):
+        """
+        Pairs up the sentences which are the same in the old and the new text. The common start and end of the two
+        texts are matched first, which is where nearly all of an edit's sentences are, and only the middle is diffed.
+        :param old: list of (sentence, start, end, errors) of the old text
+        :param new: list of (sentence, start, end) of the new text
+        :return: list of (old index, new index) of the same sentences
+        """
+        pairs = []
+        prefix = 0
+        while prefix < len(old) and prefix < len(new) and old[prefix][0] == new[prefix][0]:
+            pairs.append((prefix, prefix))
+            prefix += 1
+
+        suffix = 0
+        while suffix < len(old) - prefix and suffix < len(new) - prefix and old[-1 - suffix][0] == new[-1 - suffix][0]:
+            suffix += 1
+            pairs.append((len(old) - suffix, len(new) - suffix))
+
+        matcher = SequenceMatcher(None, [s[0] for s in old[prefix:len(old) - suffix]],
+                                  [s[0] for s in new[prefix:len(new) - suffix]], autojunk=False)
+        for block in matcher.get_matching_blocks():
+            for i in range(block.size):
+                pairs.append((prefix + block.a + i, prefix + block.b + i))
+        return pairs
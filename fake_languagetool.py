@@ -0,0 +1,150 @@
+# Feature: Fake LanguageTool
+# A small stand in for LanguageTool, so that the checks and the LanguageTool pool can be run without Java or network.
+# It can be used in process (FakeLanguageTool) or as a local HTTP server speaking the LanguageTool protocol that
+# language_check uses, with language_tool_pool.RemoteLanguageTool as the client.
+
+import argparse
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.etree import ElementTree
+from language_tool_pool import Match
+
+# (rule id, category, pattern, message) of the rules the fake knows about, the ids are the ones LanguageTool uses
+FAKE_RULES = [
+    ('EN_A_VS_AN', 'Miscellaneous', r'\b[Aa] (?=[aeiouAEIOU]\w)',
+     "Use 'an' instead of 'a' if the following word starts with a vowel sound, e.g. 'an article', 'an hour'"),
+    ('EN_A_VS_AN', 'Miscellaneous', r'\b[Aa]n (?=[b-df-gj-np-tv-zB-DF-GJ-NP-TV-Z]\w)',
+     "Use 'a' instead of 'an' if the following word doesn't start with a vowel sound, e.g. 'a sentence', 'a university'"),
+    ('ENGLISH_WORD_REPEAT_RULE', 'Miscellaneous', r'(?i)\b(\w+) \1\b', 'Possible typo: you repeated a word'),
+    ('UPPERCASE_SENTENCE_START', 'Capitalization', r'^[a-z]', 'This sentence does not start with an uppercase letter'),
+    ('WHITESPACE_RULE', 'Miscellaneous', r'(?<=\S)  +(?=\S)', 'Possible typo: you repeated a whitespace'),
+    ('SENTENCE_WHITESPACE', 'Miscellaneous', r'(?<=[a-z][.?!])[A-Z]', 'Add a space between sentences'),
+    ('MORFOLOGIK_RULE_EN_US', 'Possible Typo', r'\b\w*(\w)\1\1\w*\b', 'Possible spelling mistake found'),
+    ('PASSIVE_VOICE', 'Style', r'\b(?:is|are|was|were|been|being) \w+ed\b',
+     'Passive voice: consider using an active verb if the subject is known'),
+]
+
+# ids of the rules which, like in LanguageTool, only run if they are enabled
+OFF_BY_DEFAULT = {'PASSIVE_VOICE'}
+
+
+class FakeLanguageTool:
+    """
+    In process stand in for language_check.LanguageTool, which finds a few of the LanguageTool rules with regexes.
+    """
+
+    def __init__(self, language='en-US', delay=0.0):
+        """
+        :param language: language of the texts, only kept for the same interface
+        :param delay: seconds every check sleeps, to stand in for the LanguageTool round trip
+        """
+        self.language = language
+        self.delay = delay
+        self.disabled = set()
+        self.enabled = set()
+
+    def check(self, text):
+        """
+        Checks the text with the rules which aren't disabled. Like in LanguageTool, enabling a rule adds it to the rules
+        which are on by default, it doesn't turn the others off.
+        :param text: text to be checked for errors
+        :return: list of matches ordered by offset
+        """
+        if self.delay:
+            time.sleep(self.delay)
+
+        matches = []
+        for rule_id, category, pattern, msg in FAKE_RULES:
+            if rule_id in self.disabled or (rule_id in OFF_BY_DEFAULT and rule_id not in self.enabled):
+                continue
+            for found in re.finditer(pattern, text, re.MULTILINE):
+                matches.append(Match({'ruleId': rule_id, 'category': category, 'msg': msg,
+                                      'offset': found.start(), 'errorlength': found.end() - found.start(),
+                                      'context': text, 'contextoffset': found.start()}))
+        return sorted(matches, key=lambda match: match.offset)
+
+    def disable_spellchecking(self):
+        self.disabled.add('MORFOLOGIK_RULE_EN_US')
+
+    def enable_spellchecking(self):
+        self.disabled.discard('MORFOLOGIK_RULE_EN_US')
+
+
+class FakeLanguageToolHandler(BaseHTTPRequestHandler):
+    """
+    Answers LanguageTool requests with the matches of a FakeLanguageTool, and fails every fail_every-th request to
+    stand in for a crashed server.
+    """
+
+    delay = 0.0
+    fail_every = 0
+    requests = 0
+    requests_lock = threading.Lock()
+
+    def do_POST(self):
+        with self.requests_lock:
+            type(self).requests += 1
+            count = type(self).requests
+        if self.fail_every and count % self.fail_every == 0:
+            self.send_error(500, 'Fake LanguageTool failure')
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        params = urllib.parse.parse_qs(self.rfile.read(length).decode('utf-8'))
+        tool = FakeLanguageTool(params.get('language', ['en-US'])[0], self.delay)
+        tool.disabled = set(','.join(params.get('disabled', [])).split(',')) - {''}
+        tool.enabled = set(','.join(params.get('enabled', [])).split(',')) - {''}
+
+        root = ElementTree.Element('matches', software='LanguageTool', version='fake')
+        for match in tool.check(params.get('text', [''])[0]):
+            ElementTree.SubElement(root, 'error', {
+                'fromy': '0', 'fromx': str(match.offset), 'toy': '0', 'tox': str(match.offset + match.errorlength),
+                'ruleId': match.ruleId, 'msg': match.msg, 'replacements': '#'.join(match.replacements),
+                'context': match.context, 'contextoffset': str(match.contextoffset), 'offset': str(match.offset),
+                'errorlength': str(match.errorlength), 'category': match.category, 'locqualityissuetype': 'misspelling'
+            })
+        body = ElementTree.tostring(root, encoding='utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(host='127.0.0.1', port=0, delay=0.0, fail_every=0):
+    """
+    Starts a fake LanguageTool server on a background thread
+    :param host: host to listen on
+    :param port: port to listen on, any free port if 0
+    :param delay: seconds every request sleeps, to stand in for the LanguageTool round trip
+    :param fail_every: every fail_every-th request fails with a 500, never if 0
+    :return: the server and its url, server.shutdown() stops it
+    """
+    handler = type('Handler', (FakeLanguageToolHandler,), {'delay': delay, 'fail_every': fail_every, 'requests': 0})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://{}:{}/'.format(*server.server_address[:2])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake LanguageTool server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds every request sleeps')
+    parser.add_argument('--fail-every', type=int, default=0, help='fail every n-th request with a 500')
+    args = parser.parse_args()
+
+    server, url = start_server(args.host, args.port, args.delay, args.fail_every)
+    print('Fake LanguageTool listening on {}'.format(url))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
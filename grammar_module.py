@@ -0,0 +1,22 @@
+# Feature: Loading the grammar check module
+# 'Grammer Methods.py' can't be imported by name because of the space in it, so the other entry points load it by path
+
+import importlib.util
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_grammar_module():
+    """
+    Imports 'Grammer Methods.py', once per process
+    :return: the module, with the Flask app and the module level GrammarCheck
+    """
+    if 'grammer_methods' in sys.modules:
+        return sys.modules['grammer_methods']
+    spec = importlib.util.spec_from_file_location('grammer_methods', os.path.join(HERE, 'Grammer Methods.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,271 @@
+# Feature: Pool of LanguageTool instances
+# Checks many texts with LanguageTool at the same time instead of one round trip after the other
+
+import logging
+import os
+import queue
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from xml.etree import ElementTree
+
+# LanguageTool rules whose matches aren't reported: repeated whitespace, space between sentences and spelling. They
+# are turned off on LanguageTool itself, the spelling rule is one of the slowest ones.
+DISABLED_RULES = ['WHITESPACE_RULE', 'SENTENCE_WHITESPACE', 'MORFOLOGIK_RULE_EN_US']
+# LanguageTool rules which look at the sentences before the one they match in, like repeated sentence beginnings. The
+# sentences are checked in groups but cached on their own, so their matches would depend on which sentences happened to
+# be grouped together. They are turned off by default. The brackets and quotes rules are kept, the sentences with
+# brackets or quotes are checked on their own instead.
+CONTEXT_RULES = ['ENGLISH_WORD_REPEAT_BEGINNING_RULE']
+
+
+class LanguageToolError(Exception):
+    """
+    Raised when LanguageTool fails or times out on a text even after the instance was restarted.
+    """
+
+
+class Match:
+    """
+    A LanguageTool match, with the same attributes as language_check.Match.
+    """
+
+    def __init__(self, attrib):
+        """
+        :param attrib: the attributes of the <error> element LanguageTool returns
+        """
+        self.fromy = int(attrib.get('fromy', 0))
+        self.fromx = int(attrib.get('fromx', 0))
+        self.toy = int(attrib.get('toy', 0))
+        self.tox = int(attrib.get('tox', 0))
+        self.ruleId = attrib.get('ruleId', '')
+        self.msg = attrib.get('msg', '')
+        self.replacements = [r for r in attrib.get('replacements', '').split('#') if r]
+        self.context = attrib.get('context', '')
+        self.contextoffset = int(attrib.get('contextoffset', 0))
+        self.offset = int(attrib.get('offset', 0))
+        self.errorlength = int(attrib.get('errorlength', 0))
+        self.category = attrib.get('category', '')
+        self.locqualityissuetype = attrib.get('locqualityissuetype', '')
+
+    def __repr__(self):
+        return 'Match({!r}, {!r}, offset={}, errorlength={})'.format(self.ruleId, self.msg, self.offset, self.errorlength)
+
+
+class RemoteLanguageTool:
+    """
+    Client for a LanguageTool server which is already running at some url, like a LanguageTool server started by hand
+    or the one of fake_languagetool.py. It has the same interface as language_check.LanguageTool.
+    """
+
+    def __init__(self, url, language='en-US', timeout=30):
+        """
+        :param url: url of the LanguageTool server
+        :param language: language of the texts
+        :param timeout: seconds to wait for the server
+        """
+        self.url = url
+        self.language = language
+        self.timeout = timeout
+        self.disabled = set()
+        self.enabled = set()
+
+    def check(self, text):
+        """
+        Checks the text on the server
+        :param text: text to be checked for errors
+        :return: list of matches
+        """
+        params = {'language': self.language, 'text': text.encode('utf-8')}
+        if self.disabled:
+            params['disabled'] = ','.join(sorted(self.disabled))
+        if self.enabled:
+            params['enabled'] = ','.join(sorted(self.enabled))
+
+        with urllib.request.urlopen(self.url, urllib.parse.urlencode(params).encode(), self.timeout) as f:
+            root = ElementTree.parse(f).getroot()
+        return [Match(e.attrib) for e in root if e.tag == 'error']
+
+    def disable_spellchecking(self):
+        self.disabled.add('MORFOLOGIK_RULE_EN_{}'.format(self.language.split('-')[-1].upper()))
+
+    def enable_spellchecking(self):
+        self.disabled.discard('MORFOLOGIK_RULE_EN_{}'.format(self.language.split('-')[-1].upper()))
+
+
+class LanguageToolPool:
+    """
+    Keeps a pool of LanguageTool instances and checks texts on them concurrently from a thread pool. An instance which
+    raises or times out is thrown away and a fresh one is made in its place.
+
+    The instances are clients, not servers. language_check runs a single LanguageTool server per process, kept on the
+    LanguageTool class, and a RemoteLanguageTool talks to the one server at its url, so the pool multiplexes the texts
+    onto that server and doesn't isolate them from its crashes. A fresh language_check instance only starts the server
+    if it isn't running, and when a check fails language_check restarts the server itself, which also fails the checks
+    running on it at that moment; those are retried like any other failure.
+    """
+
+    def __init__(self, size=4, timeout=60, retries=1, factory=None, language='en-US', disabled_rules=(),
+                 enabled_rules=(), disabled_categories=(), enabled_categories=()):
+        """
+        :param size: number of LanguageTool instances, and of texts checked at the same time
+        :param timeout: seconds to wait for the result of a single text
+        :param retries: number of times a text is checked again on a fresh instance when LanguageTool fails
+        :param factory: function returning a new LanguageTool like object with a check(text) method,
+                        language_check.LanguageTool(language) if None
+        :param language: language of the texts
+        :param disabled_rules: ids of the rules LanguageTool doesn't run
+        :param enabled_rules: ids of the rules LanguageTool runs even if they are off by default
+        :param disabled_categories: categories whose matches are dropped
+        :param enabled_categories: if given, only the matches of these categories are kept
+        """
+        self.size = size
+        self.disabled_rules = set(disabled_rules)
+        self.enabled_rules = set(enabled_rules)
+        self.disabled_categories = set(disabled_categories)
+        self.enabled_categories = set(enabled_categories)
+        self.timeout = timeout
+        self.retries = retries
+        self.language = language
+        self.factory = factory if factory is not None else self.language_check_factory
+        self.restarts = 0
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        # language_check starts its server when the first instance is made, which isn't safe from many threads at once
+        self._factory_lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def language_check_factory(self):
+        """
+        Makes a language_check.LanguageTool, which starts the LanguageTool server if it isn't running
+        :return: the LanguageTool
+        """
+        import language_check
+        return language_check.LanguageTool(self.language)
+
+    def rule_config(self):
+        """
+        The rules and categories which are turned on or off
+        :return: dictionary of sorted lists
+        """
+        return {'language': self.language,
+                'disabled_rules': sorted(self.disabled_rules), 'enabled_rules': sorted(self.enabled_rules),
+                'disabled_categories': sorted(self.disabled_categories),
+                'enabled_categories': sorted(self.enabled_categories)}
+
+    def check(self, text):
+        """
+        Checks a single text
+        :param text: text to be checked for errors
+        :return: list of LanguageTool matches
+        """
+        return self.check_many([text])[0]
+
+    def check_many(self, texts, deadline=None):
+        """
+        Checks the texts concurrently on the instances of the pool
+        :param texts: list of texts to be checked for errors
+        :param deadline: time.monotonic() by which the caller needs the results, or None to wait up to the timeout.
+                         Texts still being checked at the deadline finish on their instance, which is kept.
+        :return: list with the list of LanguageTool matches for each of the texts, in the order of the texts
+        """
+        executor = self._get_executor()
+        tasks = []
+        for text in texts:
+            abandoned = threading.Event()
+            tasks.append((executor.submit(self._check, text, abandoned), abandoned))
+
+        results = []
+        try:
+            for future, abandoned in tasks:
+                if deadline is not None and deadline - time.monotonic() < self.timeout:
+                    # the caller runs out of time first, which isn't the instance's fault
+                    try:
+                        results.append(future.result(timeout=max(deadline - time.monotonic(), 0)))
+                    except TimeoutError:
+                        raise LanguageToolError('LanguageTool did not answer before the deadline')
+                    continue
+                try:
+                    results.append(future.result(timeout=self.timeout))
+                except TimeoutError:
+                    abandoned.set()
+                    raise LanguageToolError('LanguageTool did not answer within {} seconds'.format(self.timeout))
+        finally:
+            # the texts still waiting for an instance are not needed anymore once one of them failed
+            for future, _ in tasks[len(results):]:
+                future.cancel()
+
+        return results
+
+    def _check(self, text, abandoned):
+        for attempt in range(self.retries + 1):
+            tool = self._acquire()
+            try:
+                matches = tool.check(text)
+            except Exception as e:
+                self._discard(tool)
+                logging.error("LanguageTool failed, restarting the instance - {}".format(str(e)))
+                if attempt == self.retries:
+                    raise LanguageToolError(str(e))
+                continue
+
+            # an instance that took longer than the timeout is not trusted anymore
+            if abandoned.is_set():
+                self._discard(tool)
+            else:
+                self._release(tool)
+
+            # language_check can't send categories to LanguageTool, so their matches are dropped here
+            if self.disabled_categories or self.enabled_categories:
+                matches = [match for match in matches if match.category not in self.disabled_categories
+                           and (not self.enabled_categories or match.category in self.enabled_categories)]
+            return matches
+
+    def _acquire(self):
+        # every instance in use holds a slot, so there are never more than size instances
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        try:
+            with self._factory_lock:
+                tool = self.factory()
+        except Exception:
+            self._slots.release()
+            raise
+
+        # the rules are turned off on the instance, so LanguageTool doesn't spend any time on them
+        tool.disabled.update(self.disabled_rules)
+        tool.enabled.update(self.enabled_rules)
+        return tool
+
+    def _release(self, tool):
+        self._idle.put(tool)
+        self._slots.release()
+
+    def _discard(self, tool):
+        with self._lock:
+            self.restarts += 1
+        self._slots.release()
+
+    def _get_executor(self):
+        # threads don't survive a fork, so a forked worker makes its own executor
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.size)
+                self._pid = os.getpid()
+            return self._executor
+
+    def warm_up(self):
+        """
+        Makes all of the instances of the pool up front instead of on the first texts
+        """
+        tools = [self._acquire() for _ in range(self.size)]
+        for tool in tools:
+            self._release(tool)
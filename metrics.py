@@ -0,0 +1,167 @@
+# Feature: Metrics
+# Counters and latency histograms of the grammar check pipeline, exported in the Prometheus text format
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    Latency histogram of a single series, with cumulative buckets like Prometheus expects.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+class Metrics:
+    """
+    Counters and histograms keyed on a metric name and a single label. Every observation can also be added up in a
+    per request breakdown, which is kept per thread.
+    """
+
+    def __init__(self, prefix='gramcheck'):
+        """
+        :param prefix: prefix of the exported metric names
+        """
+        self.prefix = prefix
+        self.histograms = {}  # (name, label name, label value) -> Histogram
+        self.counters = {}  # (name, label name, label value) -> value
+        self.help = {}
+        self.collectors = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def describe(self, name, text):
+        """
+        Sets the help text of a metric
+        :param name: name of the metric, without the prefix
+        :param text: the help text
+        """
+        self.help[name] = text
+
+    def observe(self, name, label, value, seconds):
+        """
+        Adds a latency to a histogram, and to the breakdown of the current request if there is one
+        :param name: name of the histogram, without the prefix
+        :param label: name of the label, like 'stage'
+        :param value: value of the label
+        :param seconds: the latency
+        """
+        key = (name, label, value)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+        timings = getattr(self._local, 'timings', None)
+        if timings is not None:
+            timings[value] = timings.get(value, 0.0) + seconds
+
+    def count(self, name, label=None, value=None, amount=1):
+        """
+        Adds to a counter
+        :param name: name of the counter, without the prefix
+        :param label: name of the label, None if the counter has no label
+        :param value: value of the label
+        :param amount: amount added
+        """
+        key = (name, label, value)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    @contextmanager
+    def time(self, name, label, value):
+        """
+        Times the block into a histogram
+        :param name: name of the histogram, without the prefix
+        :param label: name of the label
+        :param value: value of the label
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, label, value, time.perf_counter() - start)
+
+    @contextmanager
+    def breakdown(self):
+        """
+        Adds up the time spent in every stage and check of the block, on the current thread
+        :return: dictionary of the seconds spent per stage or check, filled in as the block runs
+        """
+        outer = getattr(self._local, 'timings', None)
+        timings = self._local.timings = {}
+        try:
+            yield timings
+        finally:
+            self._local.timings = outer
+
+    def render(self):
+        """
+        The metrics in the Prometheus text format
+        :return: the text
+        """
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items(), key=lambda item: [str(k) for k in item[0]])
+            histograms = sorted(((key, (list(h.counts), h.sum, h.count, h.buckets)) for key, h in self.histograms.items()),
+                                key=lambda item: [str(k) for k in item[0]])
+
+        for collector in self.collectors:
+            for name, value in collector():
+                counters.append(((name, None, None), value))
+
+        described = set()
+        for (name, label, value), amount in counters:
+            full = '{}_{}'.format(self.prefix, name)
+            if name not in described:
+                described.add(name)
+                lines.append('# HELP {} {}'.format(full, self.help.get(name, name)))
+                lines.append('# TYPE {} counter'.format(full))
+            lines.append('{}{} {}'.format(full, format_labels(label, value), amount))
+
+        for (name, label, value), (counts, total, count, buckets) in histograms:
+            full = '{}_{}'.format(self.prefix, name)
+            if name not in described:
+                described.add(name)
+                lines.append('# HELP {} {}'.format(full, self.help.get(name, name)))
+                lines.append('# TYPE {} histogram'.format(full))
+            cumulative = 0
+            for bound, bucket in zip(list(buckets) + ['+Inf'], counts):
+                cumulative += bucket
+                lines.append('{}_bucket{} {}'.format(full, format_labels(label, value, le=bound), cumulative))
+            lines.append('{}_sum{} {}'.format(full, format_labels(label, value), total))
+            lines.append('{}_count{} {}'.format(full, format_labels(label, value), count))
+
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(label, value, le=None):
+    """
+    Formats the labels of a sample
+    :param label: name of the label, None if there is none
+    :param value: value of the label
+    :param le: upper bound of a histogram bucket, if the sample is one
+    :return: the labels like {stage="tagging",le="0.5"}, or an empty string
+    """
+    pairs = []
+    if label is not None:
+        pairs.append('{}="{}"'.format(label, str(value).replace('\\', '\\\\').replace('"', '\\"')))
+    if le is not None:
+        pairs.append('le="{}"'.format(le))
+    return '{' + ','.join(pairs) + '}' if pairs else ''
@@ -0,0 +1,99 @@
+# Feature: Parallel checking of long documents
+# The sentences of a long document are split into chunks which are checked at the same time on a pool of processes,
+# forked from the warmed up GrammarCheck so they share its models, and the findings are put back in the order of the
+# sentences. Shorter documents are checked in the request's own thread, where sending them to the pool would cost more
+# than it saves.
+
+import multiprocessing
+import os
+from metrics import Metrics
+
+# the GrammarCheck of a pool process, set by init_worker
+checker = None
+
+
+def init_worker(parent):
+    """
+    Sets up a pool process with the checker it was forked with, whose models are already loaded and shared with the
+    parent copy-on-write
+    :param parent: the GrammarCheck of the parent process
+    """
+    global checker
+    checker = parent
+    # the chunks are checked right here and cached by the parent. The metrics of the parent could have been locked by
+    # one of its threads at the fork, and aren't exported from here anyway.
+    checker.parallel = None
+    checker.cache = None
+    checker.metrics = Metrics()
+
+
+def check_chunk(chunk):
+    """
+    Checks a chunk of sentences in a pool process
+    :param chunk: (list of sentences, the text each of them is from or None, batch size)
+    :return: list of the findings of every sentence
+    """
+    sentences, owners, batch_size = chunk
+    return list(checker.check_uncached_sentences(sentences, batch_size, owners))
+
+
+class ParallelChecker:
+    """
+    A pool of processes shared by all of the requests of the process. start forks it from the warmed up checker at
+    startup, before the server has any threads, and a process which didn't start its own pool, like a pre-forked worker
+    that inherited the pool of its parent, checks every document itself.
+    """
+
+    def __init__(self, processes=None, threshold=128, chunk_sentences=32):
+        """
+        :param processes: number of processes, one per core if None
+        :param threshold: number of sentences from which a document is split over the pool
+        :param chunk_sentences: number of sentences checked together by a process
+        """
+        self.processes = processes or os.cpu_count() or 1
+        self.threshold = threshold
+        self.chunk_sentences = chunk_sentences
+        self._pool = None
+        self._pid = None
+
+    def start(self, checker):
+        """
+        Warms up the checker and forks the pool processes from it. Called before the server starts any threads, so no
+        lock is held by a thread which doesn't exist in the pool processes.
+        :param checker: the GrammarCheck the pool processes check with
+        """
+        self.close()
+        checker.warm_up()
+        # fork, so the processes get the loaded models and the checker instead of having them pickled
+        context = multiprocessing.get_context('fork')
+        self._pool = context.Pool(self.processes, initializer=init_worker, initargs=(checker,))
+        self._pid = os.getpid()
+
+    def wanted(self, sent):
+        """
+        :param sent: list of sentences to be checked
+        :return: whether this process started a pool and there are enough sentences for it to be worth it
+        """
+        return self._pool is not None and self._pid == os.getpid() and len(sent) >= self.threshold
+
+    def check(self, sent, batch_size, owners=None):
+        """
+        Checks the sentences in chunks on the pool
+        :param sent: list of sentences to be checked for errors
+        :param batch_size: number of sentences tagged together
+        :param owners: the text each of the sentences is from, all of them are from the same text if None
+        :return: generator of the list of findings for each sentence, in the order of the sentences
+        """
+        chunks = [(sent[i:i + self.chunk_sentences], owners[i:i + self.chunk_sentences] if owners is not None else None,
+                   batch_size) for i in range(0, len(sent), self.chunk_sentences)]
+        for findings in self._pool.imap(check_chunk, chunks):
+            yield from findings
+
+    def close(self):
+        """
+        Stops the processes of the pool, if this process started it
+        """
+        if self._pool is not None and self._pid == os.getpid():
+            self._pool.terminate()
+        self._pool = None
+        self._pid = None
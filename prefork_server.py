@@ -0,0 +1,262 @@
+# Feature: Pre-forking server
+# Loads the models once in a parent process and forks worker processes which serve the API on one shared socket. The
+# workers share the memory of the loaded models copy-on-write, so every core serves requests without a copy of spaCy
+# and LanguageTool each.
+
+import gc
+import logging
+import os
+import random
+import select
+import signal
+import socket
+import time
+import structured_logging
+from grammar_module import load_grammar_module
+
+
+class PreforkServer:
+    """
+    Parent process of the workers. It keeps the number of workers up, replacing the ones which exit after their
+    maximum number of requests, replaces all of them gracefully on SIGHUP and stops them on SIGTERM or SIGINT.
+    Every worker writes a byte to a pipe once it is ready to serve, and on SIGHUP the old workers are only stopped once
+    all of the new ones have, so there is never a moment without warm workers.
+    """
+
+    def __init__(self, module, args):
+        """
+        :param module: the grammar check module, with the app and the module level checker
+        :param args: the parsed command line options
+        """
+        self.module = module
+        self.args = args
+        self.workers = {}  # pid -> generation the worker was started in
+        self.generation = 0
+        self.ready = set()  # pids of the workers which are serving
+        self.pipes = {}  # read end of the pipe of a worker which isn't ready yet -> its pid
+        self.stopped = set()  # pids of the old workers which were told to stop
+        self.socket = None
+        self._stopping = False
+        self._restarting = False
+
+    def bind(self):
+        """
+        Opens the socket all of the workers accept on
+        :return: the listening socket
+        """
+        family = socket.AF_INET6 if ':' in self.args.host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.args.host, self.args.port))
+        sock.listen(self.args.backlog)
+        return sock
+
+    def run(self):
+        """
+        Loads the models, starts the workers and looks after them until stopped
+        """
+        self.socket = self.bind()
+        checker = self.module.a
+        if self.args.no_warm_up:
+            checker.ready.set()
+        else:
+            checker.warm_up()
+        # the objects made so far are never freed, so the garbage collector doesn't touch their pages in the workers
+        if hasattr(gc, 'freeze'):
+            gc.freeze()
+
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGHUP, self._restart)
+        logging.info("Serving on {}:{} with {} workers".format(self.args.host, self.args.port, self.args.workers))
+
+        while not self._stopping:
+            self.reap()
+            if self._restarting:
+                self._restarting = False
+                self.generation += 1
+            self.fill()
+            self.retire()
+            self.wait_ready(0.2)
+
+        self.stop()
+
+    def fill(self):
+        """
+        Starts workers until there are as many of the current generation as asked for
+        """
+        running = sum(1 for generation in self.workers.values() if generation == self.generation)
+        for _ in range(self.args.workers - running):
+            self.spawn()
+
+    def retire(self):
+        """
+        Tells the workers of the older generations to finish their requests and exit, once all of the workers of the
+        current generation are ready to take over
+        """
+        current = [pid for pid, generation in self.workers.items() if generation == self.generation]
+        if len(current) < self.args.workers or not self.ready.issuperset(current):
+            return
+        old = [pid for pid, generation in self.workers.items()
+               if generation != self.generation and pid not in self.stopped]
+        if old:
+            logging.info("Workers of generation {} are ready, stopping {} old workers".format(self.generation, len(old)))
+            self.stopped.update(old)
+            self.kill(old, signal.SIGTERM)
+
+    def wait_ready(self, timeout):
+        """
+        Waits up to timeout seconds for workers to say they are ready
+        """
+        if not self.pipes:
+            time.sleep(timeout)
+            return
+        readable, _, _ = select.select(list(self.pipes), [], [], timeout)
+        for fd in readable:
+            pid = self.pipes.pop(fd)
+            # nothing to read means the worker exited before it was ready, reap forgets it
+            if os.read(fd, 1):
+                self.ready.add(pid)
+            os.close(fd)
+
+    def spawn(self):
+        """
+        Forks a worker, with a pipe it tells the parent it is ready on
+        """
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            for fd in self.pipes:
+                os.close(fd)
+            self.pipes = {}
+            code = 0
+            try:
+                self.serve(write_fd)
+            except Exception as e:
+                logging.error("Worker {} failed - {}".format(os.getpid(), str(e)))
+                code = 1
+            finally:
+                # os._exit skips the atexit handlers, language_check's would stop the LanguageTool server the
+                # other workers are using. The pool is stopped and the cache changes and log records still queued are
+                # written first.
+                if self.module.a.parallel is not None:
+                    self.module.a.parallel.close()
+                if self.module.a.cache is not None:
+                    self.module.a.cache.close()
+                structured_logging.setup.stop()
+                os._exit(code)
+        os.close(write_fd)
+        self.pipes[read_fd] = pid
+        self.workers[pid] = self.generation
+
+    def serve(self, ready_fd):
+        """
+        Serves requests in a worker until it is told to stop or has served its maximum number of requests
+        :param ready_fd: write end of the pipe a byte is written to once the worker is ready to serve
+        """
+        from werkzeug.serving import make_server
+
+        stopping = []
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+        signal.signal(signal.SIGINT, lambda signum, frame: stopping.append(signum))
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+        # the SQLite connection of a cache can't be shared with the parent, every worker opens its own
+        self.module.a.cache = self.module.make_cache(self.args)
+        # the pool of the parent isn't usable here, every worker forks its own before it starts serving on threads
+        if self.module.a.parallel is not None:
+            self.module.a.parallel.start(self.module.a)
+
+        limit = None
+        if self.args.max_requests > 0:
+            # the jitter keeps the workers from all being replaced at the same time
+            limit = self.args.max_requests + random.randint(0, self.args.max_requests_jitter)
+
+        served = [0]
+        app = self.module.app
+
+        def counted(environ, start_response):
+            served[0] += 1
+            return app(environ, start_response)
+
+        server = make_server(self.args.host, self.args.port, counted, threaded=self.args.threaded,
+                             fd=self.socket.fileno())
+        # every worker waits on the socket, so accept gives up after a second when another worker took the connection,
+        # and handle_request after a second without one, so the stop flag is looked at regularly
+        server.socket.settimeout(1)
+        server.timeout = 1
+        # a threaded worker waits for the requests it is serving before it exits
+        server.daemon_threads = False
+        server.block_on_close = True
+
+        os.write(ready_fd, b'1')
+        os.close(ready_fd)
+
+        while not stopping and (limit is None or served[0] < limit):
+            server.handle_request()
+        server.server_close()
+
+    def reap(self):
+        """
+        Forgets the workers which have exited
+        """
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.workers.clear()
+                return
+            if pid == 0:
+                return
+            self.ready.discard(pid)
+            self.stopped.discard(pid)
+            if self.workers.pop(pid, None) is not None and os.WIFSIGNALED(status):
+                logging.error("Worker {} was killed by signal {}".format(pid, os.WTERMSIG(status)))
+
+    def kill(self, pids, signum):
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def stop(self):
+        """
+        Stops the workers, killing the ones which haven't finished within the graceful timeout
+        """
+        self.kill(list(self.workers), signal.SIGTERM)
+        deadline = time.monotonic() + self.args.graceful_timeout
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        self.kill(list(self.workers), signal.SIGKILL)
+        self.reap()
+        for fd in self.pipes:
+            os.close(fd)
+        self.pipes = {}
+        self.socket.close()
+
+    def _stop(self, signum, frame):
+        self._stopping = True
+
+    def _restart(self, signum, frame):
+        self._restarting = True
+
+
+if __name__ == '__main__':
+    module = load_grammar_module()
+    parser = module.make_parser()
+    parser.description = 'Grammar check API on pre-forked worker processes'
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='number of worker processes')
+    parser.add_argument('--max-requests', type=int, default=0,
+                        help='requests a worker serves before it is replaced, 0 for never')
+    parser.add_argument('--max-requests-jitter', type=int, default=0,
+                        help='up to this many requests are added at random to the maximum of every worker')
+    parser.add_argument('--graceful-timeout', type=float, default=30,
+                        help='seconds the workers get to finish their requests when stopping')
+    parser.add_argument('--backlog', type=int, default=128, help='connections waiting to be accepted')
+    args = parser.parse_args()
+
+    module.configure(args)
+    PreforkServer(module, args).run()
@@ -0,0 +1,281 @@
+# Feature: Rules for the pronouns 'I', 'He' and 'You'
+# The rules are written as data, patterns on the words and tags found at positions after the pronoun, and compiled
+# once into a matcher which finds every rule of a sentence in a single pass.
+
+import json
+import string
+
+# words which can come right after the pronoun even if their tag doesn't say so
+RULE_DIC = {'i': ['am', 'could', 'should', 'have', 'did', 'had', 'will', 'was', 'can', 'shall', 'may', 'might', 'must', 'would'],
+            'he': ['is', 'could', 'should', 'did', 'has', 'will', 'had', 'was', 'can', 'shall', 'may', 'might', 'must', 'would'],
+            'you': ['are', 'had', 'could', 'should', 'did', 'have', 'will', 'were', 'can', 'shall', 'may', 'might', 'must', 'would']
+            }
+
+# A rule fires when the sentence starts with its pronoun and all of its conditions hold. A condition is
+# (position, kind, value) where the position is counted from the pronoun at 0, and the kind is one of
+#   word / not_word      the lower case word, without punctuation, is / isn't one of value
+#   tag / not_tag        the pos tag of the word is / isn't one of value
+#   suffix / not_suffix  the lower case word, without punctuation, does / doesn't end with value
+# A rule never fires if the sentence is too short for its positions, or shorter than its length if it has one.
+# {n} in the message is the lower case word at position n without the full stops around it, and {n:raw} is the lower
+# case word with them. The messages are word for word the ones the checks always gave, the long runs of spaces in some
+# of them included, so the responses don't change. The error found spans the words from the pronoun to the last
+# position of the rule.
+PRONOUN_RULES = [
+    # I
+    {'id': 'I_HAVE_PAST_FORM', 'pronoun': 'i',
+     'when': [(1, 'word', ['have', 'had']), (2, 'not_word', ['not']), (2, 'not_tag', ['VBD', 'VBN', 'DT', 'RB'])],
+     'message': "With 'I have/had', second form of the verb should be used ({2}), like played, gone."},
+    {'id': 'I_HAVE_BEEN_FORM', 'pronoun': 'i',
+     'when': [(1, 'word', ['have']), (2, 'word', ['been']), (3, 'not_suffix', 'ing'),
+              (3, 'not_tag', ['JJ', 'VBG', 'RB', 'IN', 'UH', 'VBN', 'VBD'])],
+     'message': "With 'I have been', the verb form should be past tense                             "
+                "or present participle ({3}), like playing, gone."},
+    {'id': 'I_BEEN', 'pronoun': 'i',
+     'when': [(1, 'word', ['been'])],
+     'message': "'been' cannot come after 'I'."},
+    {'id': 'I_PRESENT_PARTICIPLE', 'pronoun': 'i',
+     'when': [(1, 'suffix', 'ing')],
+     'message': "Present participle form of the verb shouldn't be used ({1:raw})."},
+    {'id': 'I_NEEDS_VERB', 'pronoun': 'i',
+     'when': [(1, 'not_tag', ['NN', 'VBN', 'VB', 'VBD', 'NNS', 'VBP', 'JJ', 'IN', 'UH']), (1, 'not_word', RULE_DIC['i'])],
+     'message': "Wrong usage of 'I'. 'I' should be used with a verb (work, play, etc.) or modals (would, could, etc)."},
+    {'id': 'I_MODAL_HAVE_BEEN', 'pronoun': 'i',
+     'when': [(2, 'word', ['have']), (3, 'word', ['been']), (1, 'not_tag', ['MD'])],
+     'message': "You should use modals (would, could, etc.) after the Pronoun here."},
+    {'id': 'I_BEEN_NEEDS_HAVE', 'pronoun': 'i',
+     'when': [(2, 'word', ['been']), (1, 'not_word', ['have', 'had'])],
+     'message': "You should use have or had after the pronoun here."},
+    {'id': 'I_DETERMINER', 'pronoun': 'i',
+     'when': [(1, 'word', ['am', 'was']), (2, 'tag', ['NN', 'JJS', 'NNP'])],
+     'message': "You should use a determiner (a, an, the, this, etc) before the Noun                            "
+                "or Superlative adjective."},
+    {'id': 'I_AM_PARTICIPLE', 'pronoun': 'i',
+     'when': [(1, 'word', ['am', 'was']), (2, 'not_tag', ['NN', 'RB', 'JJ', 'VBN', 'IN', 'DT', 'NNP', 'VBP', 'PRP$']),
+              (2, 'not_suffix', 'ing')],
+     'message': "Present or past participle form of the verb should be used ({2}), like playing, gone, etc."},
+    {'id': 'I_HAVE_BEEN_PARTICIPLE', 'pronoun': 'i',
+     'when': [(1, 'word', ['have']), (2, 'word', ['been']), (3, 'not_suffix', 'ing'), (4, 'not_tag', ['JJ', 'VBN', 'VBD'])],
+     'message': "With sentence formations like 'I have been' we use present or past participle                                 "
+                "form of the verb ({4}) like, playing, done, gone, etc."},
+    {'id': 'I_MODAL_VERB', 'pronoun': 'i',
+     'when': [(1, 'tag', ['MD']), (2, 'not_tag', ['NN', 'VBG', 'RB', 'VB']), (2, 'not_word', ['have', 'not'])],
+     'message': "After 'I would', verb or adverb should be used like do, play, go, etc."},
+    {'id': 'I_MODAL_HAVE_BEEN_PARTICIPLE', 'pronoun': 'i',
+     'when': [(2, 'word', ['have']), (3, 'word', ['been']), (4, 'not_suffix', 'ing'),
+              (4, 'not_tag', ['VBG', 'JJ', 'VBN', 'VBD'])],
+     'message': "With sentence formations like 'I would have been' we use present                                 "
+                "or past participle form of the verb ({4}) like, playing, gone, etc."},
+
+    # He, which 'She', 'It' and 'Customer' are changed to
+    {'id': 'HE_BEEN', 'pronoun': 'he',
+     'when': [(1, 'word', ['been'])],
+     'message': "'been' should not be used here."},
+    {'id': 'HE_PRESENT_PARTICIPLE', 'pronoun': 'he',
+     'when': [(1, 'suffix', 'ing')],
+     'message': "Present participle form of the verb shouldn't be used with the pronoun ({1:raw}), like playing, singing, "
+                "etc."},
+    {'id': 'HE_NEEDS_VERB', 'pronoun': 'he',
+     'when': [(1, 'not_tag', ['NNS', 'VBZ', 'VBD', 'VBN', 'IN']), (1, 'not_word', RULE_DIC['he'])],
+     'message': "Pronoun should be used with a third form of verb like plays, works, etc,or modals like would, could, "
+                "should, etc. ({1:raw})"},
+    {'id': 'HE_HAS_FORM', 'pronoun': 'he',
+     'when': [(1, 'word', ['has', 'had']), (2, 'not_suffix', 'ing')],
+     'message': "Second form of the verb should be used with has/had ({2}) like plays, works, etc."},
+    {'id': 'HE_MODAL_HAVE_BEEN', 'pronoun': 'he',
+     'when': [(2, 'word', ['have']), (3, 'word', ['been']), (1, 'not_tag', ['MD'])],
+     'message': "You should use modals after the pronoun like would, could, etc."},
+    {'id': 'HE_BEEN_NEEDS_HAS', 'pronoun': 'he', 'length': 4,
+     'when': [(2, 'word', ['been']), (1, 'not_word', ['has', 'had'])],
+     'message': "One should use has or had."},
+    {'id': 'HE_HAS_BEEN_FORM', 'pronoun': 'he',
+     'when': [(1, 'word', ['has', 'had']), (2, 'word', ['been']), (3, 'not_suffix', 'ing'),
+              (3, 'not_tag', ['JJ', 'VBG', 'RB', 'IN', 'UH', 'VBD', 'VBN'])],
+     'message': "Wrong form of the verb is used here ({3})."},
+    {'id': 'HE_DETERMINER', 'pronoun': 'he', 'length': 4,
+     'when': [(1, 'word', ['is', 'was']), (2, 'tag', ['NN', 'JJS', 'NNP'])],
+     'message': "You should use a determiner before the Noun                             "
+                "or Superlative adjective like a, an, the, this, etc."},
+    {'id': 'HE_IS_PARTICIPLE', 'pronoun': 'he', 'length': 4,
+     'when': [(1, 'word', ['is', 'was']),
+              (2, 'not_tag', ['JJ', 'VBG', 'UH', 'JJR', 'RB', 'PRP', 'PRP$', 'DT', 'IN', 'VBP', 'NN']),
+              (2, 'not_suffix', 'ing')],
+     'message': "The present or past participle form of the verb should be used ({2}) like playing, done, etc."},
+    {'id': 'HE_MODAL_VERB', 'pronoun': 'he', 'length': 4,
+     'when': [(1, 'tag', ['MD']), (2, 'not_tag', ['NN', 'VB', 'IN']), (2, 'not_word', ['have', 'not'])],
+     'message': "After a pronoun followed by 'would', a verb or an adverb should be used ({2}) like sleep, see, etc."},
+    {'id': 'HE_MODAL_HAVE_BEEN_FORM', 'pronoun': 'he',
+     'when': [(1, 'tag', ['MD']), (2, 'word', ['have']), (3, 'word', ['been']), (4, 'not_suffix', 'ing'),
+              (4, 'not_tag', ['JJ', 'VBG', 'RB', 'VBN', 'VBD'])],
+     'message': "There is some mistake after the noun/pronoun and 'would have been' ({4})."},
+
+    # You, which 'They' and 'We' are changed to
+    {'id': 'YOU_BEEN', 'pronoun': 'you',
+     'when': [(1, 'word', ['been'])],
+     'message': "'been' cannot come after the pronoun/noun."},
+    {'id': 'YOU_PRESENT_PARTICIPLE', 'pronoun': 'you',
+     'when': [(1, 'suffix', 'ing')],
+     'message': "Present participle form of the verb should NOT be used after the pronoun/noun ( {1:raw}) like play, "
+                "work."},
+    {'id': 'YOU_NEEDS_VERB', 'pronoun': 'you',
+     'when': [(1, 'not_tag', ['NN', 'VB', 'VBD', 'VBP', 'VBN', 'IN']), (1, 'not_word', RULE_DIC['you'])],
+     'message': "Pronouns/nouns should be used with a verb or modals ({1:raw}) like you love, you sing."},
+    {'id': 'YOU_MODAL_HAVE_BEEN', 'pronoun': 'you',
+     'when': [(2, 'word', ['have']), (3, 'word', ['been']), (1, 'not_tag', ['MD'])],
+     'message': "You should use modals like would, could, etc here."},
+    {'id': 'YOU_BEEN_NEEDS_HAVE', 'pronoun': 'you',
+     'when': [(2, 'word', ['been']), (1, 'not_word', ['have', 'had'])],
+     'message': "You should use have or had after the pronoun."},
+    {'id': 'YOU_ARE_PARTICIPLE', 'pronoun': 'you',
+     'when': [(1, 'word', ['are', 'were']),
+              (2, 'not_tag', ['JJ', 'VBG', 'UH', 'JJR', 'IN', 'VBN', 'RB', 'NNP', 'DT', 'JJS']),
+              (2, 'not_suffix', 'ing')],
+     'message': "The present or past participle form of the verb should be used ({2}) like reading, gone, etc."},
+    {'id': 'YOU_HAVE_BEEN_FORM', 'pronoun': 'you',
+     'when': [(1, 'word', ['have', 'had']), (2, 'word', ['been']), (3, 'not_suffix', 'ing'),
+              (3, 'not_tag', ['JJ', 'VBG', 'RB', 'IN', 'UH'])],
+     'message': "With sentence formations like 'you have been' we use present or past participle form of the verb "
+                "({3}) like gone, singing."},
+    {'id': 'YOU_MODAL_VERB', 'pronoun': 'you',
+     'when': [(1, 'tag', ['MD']), (2, 'not_tag', ['NN', 'VB']), (2, 'not_word', ['have', 'not'])],
+     'message': "After 'you would', 'a noun, verb or adverb' is used ({2})."},
+    {'id': 'YOU_MODAL_HAVE_BEEN_FORM', 'pronoun': 'you',
+     'when': [(1, 'tag', ['MD']), (2, 'word', ['have']), (3, 'word', ['been']), (4, 'not_suffix', 'ing'),
+              (4, 'not_tag', ['JJ', 'VBG'])],
+     'message': "With sentence formations like 'you would have been'we use present or past participle form of "
+                "the verb ({4}) like told, singing, gone, etc."},
+]
+
+
+def compile_condition(position, kind, value):
+    """
+    Turns a condition of a rule into a test on the words and tags of a sentence
+    :param position: position of the word counted from the pronoun
+    :param kind: kind of the condition
+    :param value: the words, tags or suffix of the condition
+    :return: function of (words, tags) returning whether the condition holds
+    """
+    if kind in ('word', 'not_word', 'tag', 'not_tag'):
+        values = frozenset(value)
+        if kind == 'word':
+            return lambda words, tags: words[position] in values
+        if kind == 'not_word':
+            return lambda words, tags: words[position] not in values
+        if kind == 'tag':
+            return lambda words, tags: tags[position] in values
+        return lambda words, tags: tags[position] not in values
+    if kind == 'suffix':
+        return lambda words, tags: words[position].endswith(value)
+    if kind == 'not_suffix':
+        return lambda words, tags: not words[position].endswith(value)
+    raise ValueError("Unknown kind of condition '{}'".format(kind))
+
+
+class PronounRules:
+    """
+    The pronoun rules compiled into a single matcher. The rules are looked up by the pronoun and by the word after it,
+    so a sentence is only tested against the rules which can fire for its first two words, and every test is a set
+    lookup on words and tags which were found once for the whole sentence.
+    """
+
+    def __init__(self, rules=PRONOUN_RULES):
+        """
+        :param rules: list of the rules, in the order their messages are given back
+        """
+        self.rules = rules
+        # pronoun -> (dictionary of next word -> rules, rules for any other next word)
+        self._candidates = {}
+
+        compiled = []
+        for order, rule in enumerate(rules):
+            tests = tuple(compile_condition(*condition) for condition in rule['when'])
+            length = max([rule.get('length', 0)] + [position + 1 for position, _, _ in rule['when']])
+            # the words the rule needs right after the pronoun, None if it can be any word
+            next_words = None
+            for position, kind, value in rule['when']:
+                if position == 1 and kind == 'word':
+                    next_words = value
+                    break
+            last = max(position for position, _, _ in rule['when'])
+            compiled.append((order, rule['pronoun'], next_words, (rule['id'], length, last, tests)))
+
+        # the messages with the positions they use numbered in order, like a template of the other checks
+        self.templates = {}
+        self._arguments = {}
+        for rule in rules:
+            template, positions = message_template(rule['message'])
+            self.templates[rule['id']] = template
+            self._arguments[rule['id']] = positions
+
+        for pronoun in set(rule['pronoun'] for rule in rules):
+            mine = [c for c in compiled if c[1] == pronoun]
+            any_word = [c for c in mine if c[2] is None]
+            by_word = {}
+            for word in set(w for c in mine if c[2] is not None for w in c[2]):
+                found = any_word + [c for c in mine if c[2] is not None and word in c[2]]
+                by_word[word] = tuple(c[3] for c in sorted(found, key=lambda c: c[0]))
+            self._candidates[pronoun] = (by_word, tuple(c[3] for c in any_word))
+
+    def version(self):
+        """
+        :return: the rules as JSON, for the version of the rule set
+        """
+        return json.dumps(self.rules, sort_keys=True)
+
+    def match(self, tagged, pronoun=None):
+        """
+        Finds every rule which fires on a sentence
+        :param tagged: the TaggedSentence of the sentence
+        :param pronoun: only look at the rules of this pronoun if given
+        :return: list of (rule id, message) in the order of the rules
+        """
+        return [(found['code'], self.templates[found['code']].format(*found['args']))
+                for found in self.find(tagged, pronoun)]
+
+    def find(self, tagged, pronoun=None):
+        """
+        Finds every rule which fires on a sentence, with where it is in the sentence
+        :param tagged: the TaggedSentence of the sentence
+        :param pronoun: only look at the rules of this pronoun if given
+        :return: list of dictionaries with the rule id as the code, the start and end character offsets in the sentence
+                 and the words for the template of the rule, in the order of the rules
+        """
+        words = tagged.bare
+        if len(words) < 2 or tagged.text.endswith('?'):
+            return []
+        if pronoun is not None and words[0] != pronoun:
+            return []
+
+        candidates = self._candidates.get(words[0])
+        if candidates is None:
+            return []
+        by_word, any_word = candidates
+        rules = by_word.get(words[1], any_word)
+
+        tags = tagged.tags
+        found = []
+        for rule_id, length, last, tests in rules:
+            if len(words) >= length and all(test(words, tags) for test in tests):
+                found.append({'code': rule_id, 'start': tagged.offsets[0],
+                              'end': tagged.offsets[last] + len(tagged.words[last]),
+                              'args': [tagged.lower[position] if raw else tagged.lower[position].strip('.')
+                                         for position, raw in self._arguments[rule_id]]})
+        return found
+
+
+def message_template(message):
+    """
+    Numbers the positions a rule message uses in the order they come
+    :param message: the message, with {n} or {n:raw} for the word at position n
+    :return: the message with {0}, {1}, ... instead, and the list of (position, whether the word is given raw)
+    """
+    positions = []
+    template = []
+    for text, field, spec, conversion in string.Formatter().parse(message):
+        template.append(text.replace('{', '{{').replace('}', '}}'))
+        if field is not None:
+            if spec not in ('', 'raw'):
+                raise ValueError("Unknown format of position {} in '{}'".format(field, message))
+            positions.append((int(field), spec == 'raw'))
+            template.append('{' + str(len(positions) - 1) + '}')
+    return ''.join(template), positions
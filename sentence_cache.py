@@ -0,0 +1,243 @@
+# Feature: Sentence result cache
+# Keeps the errors found for a sentence, so that sentences which are sent again are not checked again
+
+import atexit
+import hashlib
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# most changes written to the SQLite file in one transaction
+WRITE_BATCH = 500
+
+# seconds between two prunings of the SQLite file by the writer thread
+PRUNE_INTERVAL = 60
+
+
+class SentenceCache:
+    """
+    LRU cache of the errors found for each sentence. The key is a hash of the sentence and the version of the rule set,
+    so a change to the rules never gives back results of the old rules. The cache is bounded by the number of entries
+    and optionally by the size of the cached results, and can be kept in a SQLite file to survive restarts.
+
+    The SQLite file is only written by a background thread, which takes the changes from a queue and commits them in
+    batches, so a request never waits for the disk. Many processes can share the file; a write which fails, like one
+    which finds the file locked for too long, is logged and dropped, which only costs a check after the next restart.
+    The file keeps when every sentence was last used. A process loads the most recently used sentences of it, and
+    evicts from its memory only, as a sentence it evicts may still be used by the others. The file is pruned on its
+    own, by the age of the sentences and their number.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=None, path=None, file_entries=None, max_age=None):
+        """
+        :param max_entries: maximum number of sentences kept
+        :param max_bytes: maximum size of the cached keys and results in UTF-8 bytes, not bounded if None
+        :param path: path of a SQLite file the cache is kept in, only kept in memory if None
+        :param file_entries: maximum number of sentences kept in the SQLite file, not bounded if None
+        :param max_age: seconds after its last use a sentence is removed from the SQLite file, never if None
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.path = path
+        self.file_entries = file_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._writes = None
+        self._writer = None
+        self._next_prune = 0
+
+        if path is not None:
+            self._writes = queue.Queue()
+            try:
+                self._db = sqlite3.connect(path, timeout=5, check_same_thread=False)
+                # the write ahead log lets the readers of other processes go on while one of them writes, and is only
+                # synced at checkpoints
+                self._db.execute('PRAGMA journal_mode=WAL')
+                self._db.execute('PRAGMA synchronous=NORMAL')
+                self._db.execute('CREATE TABLE IF NOT EXISTS sentences (key TEXT PRIMARY KEY, errors TEXT, '
+                                 'used REAL NOT NULL DEFAULT 0)')
+                # a file of before the time of last use was kept, its sentences count as the least recently used
+                if 'used' not in [row[1] for row in self._db.execute('PRAGMA table_info(sentences)')]:
+                    self._db.execute('ALTER TABLE sentences ADD COLUMN used REAL NOT NULL DEFAULT 0')
+                self._db.execute('CREATE INDEX IF NOT EXISTS sentences_used ON sentences (used)')
+                self._db.commit()
+                self._load()
+            except sqlite3.Error as e:
+                logging.error("Could not read the sentence cache {} - {}".format(path, str(e)))
+            self._writer = threading.Thread(target=self._write_loop, name='sentence-cache-writer', daemon=True)
+            self._writer.start()
+            atexit.register(self.close)
+
+    @staticmethod
+    def key(sentence, version):
+        """
+        Content address of a sentence
+        :param sentence: the sentence
+        :param version: version of the rule set the sentence is checked with
+        :return: the key of the sentence in the cache
+        """
+        return hashlib.sha1((version + '\0' + sentence).encode('utf-8')).hexdigest()
+
+    def get(self, sentence, version):
+        """
+        Looks up the errors found for a sentence
+        :param sentence: the sentence
+        :param version: version of the rule set the sentence is checked with
+        :return: list of errors, or None if the sentence is not in the cache
+        """
+        key = self.key(sentence, version)
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            if self._writes is not None:
+                self._writes.put(('UPDATE sentences SET used = ? WHERE key = ?', (time.time(), key)))
+        return json.loads(value)
+
+    def put(self, sentence, version, errors):
+        """
+        Keeps the errors found for a sentence, evicting the least recently used sentences if the cache is full
+        :param sentence: the sentence
+        :param version: version of the rule set the sentence was checked with
+        :param errors: list of errors found in the sentence
+        """
+        key = self.key(sentence, version)
+        value = json.dumps(errors)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._add(key, value)
+            if self._writes is not None:
+                self._writes.put(('INSERT OR REPLACE INTO sentences (key, errors, used) VALUES (?, ?, ?)',
+                                  (key, value, time.time())))
+            self._evict()
+
+    def clear(self):
+        """
+        Removes all of the sentences from the cache
+        """
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+            if self._writes is not None:
+                self._writes.put(('DELETE FROM sentences', ()))
+
+    def flush(self):
+        """
+        Waits until the changes so far are written to the SQLite file
+        """
+        if self._writes is not None:
+            self._writes.join()
+
+    def close(self):
+        """
+        Writes the changes still queued and stops the writer thread
+        """
+        if self._writer is None:
+            return
+        self._writes.put(None)
+        self._writer.join()
+        self._writer = None
+
+    def _write_loop(self):
+        while True:
+            batch = [self._writes.get()]
+            while len(batch) < WRITE_BATCH:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+
+            changes = [change for change in batch if change is not None]
+            try:
+                if changes and self._db is not None:
+                    with self._db:
+                        for statement, parameters in changes:
+                            self._db.execute(statement, parameters)
+            except sqlite3.Error as e:
+                logging.error("Could not write {} changes to the sentence cache {} - {}".format(
+                    len(changes), self.path, str(e)))
+            finally:
+                for _ in batch:
+                    self._writes.task_done()
+            if len(changes) < len(batch):
+                return
+            if time.monotonic() >= self._next_prune:
+                self._next_prune = time.monotonic() + PRUNE_INTERVAL
+                self._prune()
+
+    def _load(self):
+        """
+        Loads the most recently used sentences of the SQLite file, as many as fit in the cache
+        """
+        rows = []
+        size = 0
+        for key, value in self._db.execute('SELECT key, errors FROM sentences ORDER BY used DESC LIMIT ?',
+                                           (self.max_entries,)):
+            size += self._size(key, value)
+            if self.max_bytes is not None and size > self.max_bytes:
+                break
+            rows.append((key, value))
+        # least recently used first, which is the order of the cache
+        for key, value in reversed(rows):
+            self._add(key, value)
+
+    def _prune(self):
+        """
+        Removes the sentences which weren't used for max_age seconds from the SQLite file, then the least recently used
+        ones past file_entries. Runs on the writer thread.
+        """
+        if self._db is None or (self.max_age is None and self.file_entries is None):
+            return
+        try:
+            with self._db:
+                if self.max_age is not None:
+                    self._db.execute('DELETE FROM sentences WHERE used < ?', (time.time() - self.max_age,))
+                if self.file_entries is not None:
+                    self._db.execute('DELETE FROM sentences WHERE key IN '
+                                     '(SELECT key FROM sentences ORDER BY used DESC LIMIT -1 OFFSET ?)',
+                                     (self.file_entries,))
+        except sqlite3.Error as e:
+            logging.error("Could not prune the sentence cache {} - {}".format(self.path, str(e)))
+
+    def stats(self):
+        """
+        Counters of the cache
+        :return: dictionary with the hits, misses, evictions, number of entries and bytes used
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self._entries), 'bytes': self.bytes}
+
+    @staticmethod
+    def _size(key, value):
+        return len(key.encode('utf-8')) + len(value.encode('utf-8'))
+
+    def _add(self, key, value):
+        self._entries[key] = value
+        self.bytes += self._size(key, value)
+
+    def _remove(self, key):
+        value = self._entries.pop(key)
+        self.bytes -= self._size(key, value)
+
+    def _evict(self):
+        # only from memory, the SQLite file is pruned by _prune
+        while self._entries and (len(self._entries) > self.max_entries
+                                 or (self.max_bytes is not None and self.bytes > self.max_bytes)):
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
@@ -0,0 +1,153 @@
+# Feature: Structured logging
+# Log records are put on a queue by the request threads and written by a background thread, as one JSON object per
+# line to a file which is rotated by size. The per sentence records can be sampled, errors are always kept. The
+# processes forked from the one which set up logging send their records to it, so it writes the file for all of them.
+
+import atexit
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import random
+
+# logger of the record written for every sentence checked, the one which is sampled
+SENTENCE_LOGGER = 'gramcheck.sentences'
+
+# attributes every LogRecord has, anything else was passed in extra and goes in the JSON object
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as a single line JSON object, with the fields passed in extra next to the message.
+    """
+
+    def format(self, record):
+        entry = {'time': round(record.created, 3), 'level': record.levelname, 'logger': record.name,
+                 'message': record.getMessage(), 'pid': record.process}
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SampleFilter(logging.Filter):
+    """
+    Keeps a fraction of the records below WARNING, picked at random, and all of the others.
+    """
+
+    def __init__(self, rate):
+        """
+        :param rate: fraction of the records kept, between 0 and 1
+        """
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+
+class LoggingSetup:
+    """
+    The queue, handler and listener thread of the process. Only the process which set up logging writes the file, the
+    processes it forks, like the pre-forked workers and the pool processes, put their records on a queue they inherit
+    from it, which a second listener thread of that process writes to the same file. So there is one file, rotated by
+    one process, with the records of all of them in it.
+    """
+
+    def __init__(self):
+        self.listeners = []
+        self.options = None
+        self.handler = None
+        # the process writing the file, and the queue of the records of the processes forked from it
+        self.pid = None
+        self.children = None
+
+    def start(self, path='log_file.log', level=logging.INFO, max_bytes=10 * 1024 * 1024, backups=5, sample=1.0):
+        """
+        Sends the records of all loggers through a queue to a rotating JSON log file, replacing the handlers there were.
+        In a forked process they are sent to the file of the process it was forked from, and only the level and sample
+        are changed.
+        :param path: path of the log file, {pid} in it is replaced by the id of the process
+        :param level: lowest level logged
+        :param max_bytes: size at which the file is rotated, never rotated if 0
+        :param backups: number of rotated files kept
+        :param sample: fraction of the per sentence records written
+        """
+        if self.pid is not None and self.pid != os.getpid():
+            self.options = dict(path=path, level=level, max_bytes=max_bytes, backups=backups, sample=sample)
+            self.forward(level, sample)
+            return
+
+        self.stop()
+        self.options = dict(path=path, level=level, max_bytes=max_bytes, backups=backups, sample=sample)
+
+        file_handler = logging.handlers.RotatingFileHandler(path.format(pid=os.getpid()), maxBytes=max_bytes,
+                                                            backupCount=backups, encoding='utf-8', delay=True)
+        file_handler.setFormatter(JsonFormatter())
+        records = queue.Queue(-1)
+        # the records of this process don't go through a pipe, only those of the forked processes do
+        self.children = multiprocessing.get_context('fork').Queue()
+        self.listeners = [logging.handlers.QueueListener(records, file_handler),
+                          logging.handlers.QueueListener(self.children, file_handler)]
+        for listener in self.listeners:
+            listener.start()
+        self.pid = os.getpid()
+        self.use_handler(logging.handlers.QueueHandler(records), level, sample)
+
+    def forward(self, level, sample):
+        """
+        Sends the records of this forked process to the process writing the file
+        """
+        self.use_handler(logging.handlers.QueueHandler(self.children), level, sample)
+
+    def use_handler(self, handler, level, sample):
+        root = logging.getLogger()
+        for old in list(root.handlers):
+            root.removeHandler(old)
+        self.handler = handler
+        root.addHandler(handler)
+        root.setLevel(level)
+
+        # the filter is on the logger, so a record which isn't sampled never gets to the queue
+        sentences = logging.getLogger(SENTENCE_LOGGER)
+        sentences.filters = [SampleFilter(sample)]
+
+    def stop(self):
+        """
+        Writes the records still on the queues and stops the listener threads. In a forked process, waits for its
+        records to be sent to the process writing the file, as it could be about to exit without flushing them.
+        """
+        if self.pid is not None and self.pid != os.getpid():
+            if self.children is not None:
+                self.children.close()
+                self.children.join_thread()
+            return
+        for listener in self.listeners:
+            listener.stop()
+        self.listeners = []
+
+    def restart_after_fork(self):
+        if self.options is None:
+            return
+        # the listener threads of the parent aren't running in this process, its own records are just dropped and
+        # the records of this process are sent to it
+        self.listeners = []
+        self.forward(self.options['level'], self.options['sample'])
+
+
+setup = LoggingSetup()
+atexit.register(setup.stop)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=setup.restart_after_fork)
+
+
+def setup_logging(path='log_file.log', level=logging.INFO, max_bytes=10 * 1024 * 1024, backups=5, sample=1.0):
+    """
+    Sets up the logging of the process, see LoggingSetup.start
+    """
+    setup.start(path, level, max_bytes, backups, sample)
@@ -0,0 +1,262 @@
+# Feature: Pluggable taggers
+# The checks only need a Penn Treebank tag and the character offset of every token. A tagger gives back, for every
+# sentence, a list of tokens with the idx, tag_, is_punct and is_space attributes of spaCy's tokens, so spaCy can be
+# swapped for NLTK's averaged perceptron or a word to tag lookup table, which are much faster and less accurate.
+
+import hashlib
+import json
+import re
+import threading
+from collections import Counter, defaultdict, namedtuple
+from contextlib import nullcontext
+
+# a token of the taggers which aren't spaCy, with the attributes of a spaCy token the checks read
+Token = namedtuple('Token', ['text', 'idx', 'tag_', 'is_punct', 'is_space'])
+
+# splits like the Penn Treebank, "can't" into "ca" and "n't" and "he's" into "he" and "'s"
+TOKEN_PATTERN = re.compile(r"\w+(?=n't)|n't|'\w+|\w+(?:[-.]\w+)*|[^\w\s]")
+PUNCT_PATTERN = re.compile(r'[^\w\s]+')
+# Penn Treebank tags of punctuation, anything else is SYM
+PUNCT_TAGS = {'.': '.', '?': '.', '!': '.', ',': ',', ':': ':', ';': ':', '-': ':', '(': '-LRB-', ')': '-RRB-',
+              '"': "''", "'": "''"}
+
+# tags of the closed class words the rules look at, used when the lookup tagger has no table
+CLOSED_CLASS_TAGS = {
+    'i': 'PRP', 'he': 'PRP', 'she': 'PRP', 'it': 'PRP', 'you': 'PRP', 'we': 'PRP', 'they': 'PRP', 'me': 'PRP',
+    'him': 'PRP', 'her': 'PRP$', 'us': 'PRP', 'them': 'PRP', 'my': 'PRP$', 'his': 'PRP$', 'your': 'PRP$',
+    'our': 'PRP$', 'their': 'PRP$', 'its': 'PRP$',
+    'am': 'VBP', 'are': 'VBP', 'is': 'VBZ', 'was': 'VBD', 'were': 'VBD', 'be': 'VB', 'been': 'VBN', 'being': 'VBG',
+    'have': 'VBP', 'has': 'VBZ', 'had': 'VBD', 'do': 'VBP', 'does': 'VBZ', 'did': 'VBD', 'done': 'VBN',
+    'go': 'VB', 'goes': 'VBZ', 'went': 'VBD', 'gone': 'VBN', 'going': 'VBG',
+    'will': 'MD', 'would': 'MD', 'can': 'MD', 'could': 'MD', 'shall': 'MD', 'should': 'MD', 'may': 'MD',
+    'might': 'MD', 'must': 'MD', 'ca': 'MD', 'wo': 'MD',
+    'not': 'RB', "n't": 'RB', 'very': 'RB', 'also': 'RB', 'never': 'RB', 'always': 'RB', 'here': 'RB', 'there': 'EX',
+    'the': 'DT', 'a': 'DT', 'an': 'DT', 'this': 'DT', 'that': 'IN', 'these': 'DT', 'those': 'DT', 'some': 'DT',
+    'any': 'DT', 'every': 'DT', 'no': 'DT', 'all': 'DT',
+    'in': 'IN', 'on': 'IN', 'at': 'IN', 'of': 'IN', 'for': 'IN', 'with': 'IN', 'from': 'IN', 'by': 'IN',
+    'about': 'IN', 'since': 'IN', 'because': 'IN', 'if': 'IN', 'than': 'IN', 'to': 'TO',
+    'and': 'CC', 'or': 'CC', 'but': 'CC', 'so': 'RB',
+    'good': 'JJ', 'happy': 'JJ', 'best': 'JJS', 'better': 'JJR', 'well': 'RB',
+}
+
+
+def tokenize(sentence):
+    """
+    Splits a sentence into tokens the way the Penn Treebank does
+    :param sentence: the sentence
+    :return: list of (character offset, token)
+    """
+    return [(m.start(), m.group()) for m in TOKEN_PATTERN.finditer(sentence)]
+
+
+class SpacyTagger:
+    """
+    spaCy's tagger, the most accurate one. Only the tagger of the model is loaded, the first time it is needed.
+    """
+
+    name = 'spacy'
+
+    def __init__(self, model='en', disabled=('parser', 'ner'), metrics=None):
+        """
+        :param model: name of the spaCy model
+        :param disabled: components of the model which aren't loaded
+        :param metrics: Metrics the time spent loading the model is recorded in, if given
+        """
+        self.model = model
+        self.disabled = list(disabled)
+        self.metrics = metrics
+        self._nlp = None
+        self._lock = threading.Lock()
+
+    @property
+    def nlp(self):
+        if self._nlp is None:
+            with self._lock:
+                if self._nlp is None:
+                    import spacy
+                    timer = self.metrics.time('stage_seconds', 'stage', 'load_spacy') if self.metrics else nullcontext()
+                    with timer:
+                        self._nlp = spacy.load(self.model, disable=self.disabled)
+        return self._nlp
+
+    def config(self):
+        return {'tagger': self.name, 'model': self.model}
+
+    def warm_up(self):
+        self.tag('I am warming up.')
+
+    def tag(self, sentence):
+        """
+        Tags a sentence
+        :param sentence: the sentence
+        :return: the spaCy Doc, a list of tokens
+        """
+        return self.nlp(sentence)
+
+    def tag_many(self, sentences, batch_size=256):
+        """
+        Tags sentences, batch_size at a time
+        :param sentences: list of sentences
+        :param batch_size: number of sentences spaCy tags together
+        :return: generator of the spaCy Doc of every sentence
+        """
+        return self.nlp.pipe(sentences, batch_size=batch_size)
+
+
+class NltkTagger:
+    """
+    NLTK's averaged perceptron tagger, on the Penn Treebank style tokens of tokenize.
+    """
+
+    name = 'nltk'
+
+    def __init__(self):
+        self._tagger = None
+        self._lock = threading.Lock()
+
+    @property
+    def tagger(self):
+        if self._tagger is None:
+            with self._lock:
+                if self._tagger is None:
+                    from nltk.tag.perceptron import PerceptronTagger
+                    self._tagger = PerceptronTagger()
+        return self._tagger
+
+    def config(self):
+        return {'tagger': self.name}
+
+    def warm_up(self):
+        self.tag('I am warming up.')
+
+    def tag(self, sentence):
+        """
+        Tags a sentence
+        :param sentence: the sentence
+        :return: list of Tokens
+        """
+        tokens = tokenize(sentence)
+        tags = self.tagger.tag([token for _, token in tokens]) if tokens else []
+        return [Token(token, idx, tag, bool(PUNCT_PATTERN.fullmatch(token)), False)
+                for (idx, token), (_, tag) in zip(tokens, tags)]
+
+    def tag_many(self, sentences, batch_size=256):
+        """
+        Tags sentences one after the other, the perceptron has nothing to gain from batches
+        :return: generator of the list of Tokens of every sentence
+        """
+        return (self.tag(sentence) for sentence in sentences)
+
+
+class LookupTagger:
+    """
+    Tags every word with the tag it has most often, from a table of lower case words. The words which aren't in the
+    table are guessed from their spelling. It knows nothing about the context of a word, so it is the least accurate
+    and by far the fastest tagger.
+    """
+
+    name = 'lookup'
+
+    def __init__(self, table=None, path=None):
+        """
+        :param table: dictionary of lower case word -> tag, CLOSED_CLASS_TAGS if None
+        :param path: JSON file the table is read from, instead of table
+        """
+        if path is not None:
+            with open(path, encoding='utf-8') as f:
+                table = json.load(f)
+        self.table = table if table is not None else CLOSED_CLASS_TAGS
+        self.path = path
+
+    @classmethod
+    def build(cls, tagger, sentences, min_count=1):
+        """
+        Makes the table from the tags another tagger gives a corpus
+        :param tagger: the tagger whose tags are counted, like SpacyTagger
+        :param sentences: the sentences of the corpus
+        :param min_count: number of times a word has to be seen to be in the table
+        :return: the LookupTagger
+        """
+        counts = defaultdict(Counter)
+        for tokens in tagger.tag_many(sentences):
+            for token in tokens:
+                if not token.is_punct and not token.is_space:
+                    counts[token.text.lower()][token.tag_] += 1
+        table = dict(CLOSED_CLASS_TAGS)
+        for word, tags in counts.items():
+            if sum(tags.values()) >= min_count:
+                table[word] = tags.most_common(1)[0][0]
+        return cls(table)
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.table, f, indent=0, sort_keys=True)
+
+    def config(self):
+        table = json.dumps(self.table, sort_keys=True).encode('utf-8')
+        return {'tagger': self.name, 'table': hashlib.sha1(table).hexdigest()}
+
+    def warm_up(self):
+        pass
+
+    def guess(self, word, first):
+        """
+        Tag of a word which isn't in the table
+        :param word: the word
+        :param first: whether it is the first word of the sentence, which is capitalised anyway
+        :return: the tag
+        """
+        lower = word.lower()
+        if word[0].isdigit():
+            return 'CD'
+        if word[0].isupper() and not first:
+            return 'NNP'
+        if lower.endswith('ing'):
+            return 'VBG'
+        if lower.endswith('ed'):
+            return 'VBD'
+        if lower.endswith('ly'):
+            return 'RB'
+        if lower.endswith('s') and not lower.endswith('ss'):
+            return 'NNS'
+        return 'NN'
+
+    def tag(self, sentence):
+        """
+        Tags a sentence
+        :param sentence: the sentence
+        :return: list of Tokens
+        """
+        tokens = []
+        for idx, token in tokenize(sentence):
+            if PUNCT_PATTERN.fullmatch(token):
+                tokens.append(Token(token, idx, PUNCT_TAGS.get(token, 'SYM'), True, False))
+                continue
+            tag = self.table.get(token.lower())
+            if tag is None:
+                tag = self.guess(token, not tokens)
+            tokens.append(Token(token, idx, tag, False, False))
+        return tokens
+
+    def tag_many(self, sentences, batch_size=256):
+        """
+        :return: generator of the list of Tokens of every sentence
+        """
+        return (self.tag(sentence) for sentence in sentences)
+
+
+def make_tagger(name, table=None, metrics=None):
+    """
+    Makes a tagger by its name
+    :param name: 'spacy', 'nltk' or 'lookup'
+    :param table: JSON file of the lookup tagger's table, the built in closed class words if None
+    :param metrics: Metrics spaCy's loading time is recorded in
+    :return: the tagger
+    """
+    if name == 'spacy':
+        return SpacyTagger(metrics=metrics)
+    if name == 'nltk':
+        return NltkTagger()
+    if name == 'lookup':
+        return LookupTagger(path=table)
+    raise ValueError("Unknown tagger '{}'".format(name))
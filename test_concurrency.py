@@ -0,0 +1,177 @@
+# Stress test of the isolation of concurrent checks: texts checked from many threads at the same time, on the checker
+# itself and through the Flask app, give back the same errors as when they are checked one after the other.
+# Run with `python -m unittest test_concurrency` or pytest. It needs Flask, but not LanguageTool, which is replaced by
+# the fake LanguageTool. The texts are split with nltk's punkt if it is there, and always with a regex splitter too.
+# The checks run on the lookup tagger, and on the default spaCy tagger, whose docs are tagged by a stand in pipeline
+# with the interface of spaCy's when spaCy or its model isn't installed.
+
+import functools
+import random
+import re
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from benchmark import make_sentence
+from fake_languagetool import FakeLanguageTool
+from grammar_module import load_grammar_module
+from language_tool_pool import DISABLED_RULES, LanguageToolPool
+from taggers import LookupTagger, SpacyTagger
+
+THREADS = 16
+TEXTS = 300
+SENTENCE_PATTERN = re.compile(r'[^.?!]+[.?!]*')
+
+
+def can_split_sentences():
+    try:
+        load_grammar_module().sent_tokenize('It is loaded. It works.')
+    except (ImportError, LookupError):
+        return False
+    return True
+
+
+def regex_sent_tokenize(text):
+    """
+    Splits a text after every run of '.', '?' and '!', which is all the texts of the test need
+    """
+    return [s.strip() for s in SENTENCE_PATTERN.findall(text) if s.strip()]
+
+
+class StandInDoc:
+    """
+    The tokens of a sentence, iterated like a spaCy Doc
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+    def __iter__(self):
+        return iter(self.tokens)
+
+    def __len__(self):
+        return len(self.tokens)
+
+
+class StandInPipeline:
+    """
+    Stands in for a loaded spaCy pipeline: calling it tags one text, and pipe tags texts lazily, giving the other
+    threads a chance to run between two docs like spaCy does between batches. The tags are the lookup tagger's.
+    """
+
+    def __init__(self):
+        self.lookup = LookupTagger()
+
+    def __call__(self, text):
+        return StandInDoc(self.lookup.tag(text))
+
+    def pipe(self, texts, batch_size=256):
+        for text in texts:
+            threading.Event().wait(0)
+            yield self(text)
+
+
+def make_spacy_tagger():
+    """
+    The default tagger of GrammarCheck, on the real spaCy model if it can be loaded and on the stand in pipeline if not
+    """
+    tagger = SpacyTagger()
+    try:
+        tagger.warm_up()
+    except (ImportError, OSError):
+        tagger._nlp = StandInPipeline()
+    return tagger
+
+
+def make_texts(count, seed=0):
+    """
+    Makes distinct texts of one to four sentences with a mix of pronouns, lengths and errors
+    :return: list of texts
+    """
+    rng = random.Random(seed)
+    texts = set()
+    while len(texts) < count:
+        sentences = [make_sentence(rng, rng.randint(2, 12), 'mixed') for _ in range(rng.randint(1, 4))]
+        texts.add(' '.join(sentence if sentence[-1] in '.?!' else sentence + '.' for sentence in sentences))
+    return sorted(texts)
+
+
+class ConcurrencyChecks:
+    """
+    The tests, run by the test cases below with their tagger and sentence splitter
+    """
+
+    def make_tagger(self):
+        return LookupTagger()
+
+    def setUp(self):
+        self.module = load_grammar_module()
+        factory = functools.partial(FakeLanguageTool, 'en-US')
+        # no cache, so every text is really checked by every thread
+        self.checker = self.module.GrammarCheck(
+            tool=LanguageToolPool(size=4, factory=factory, disabled_rules=DISABLED_RULES), tagger=self.make_tagger())
+        self.texts = make_texts(TEXTS)
+        self.expected = [self.checker.grammar_check(text) for text in self.texts]
+
+        # the routes check on the module level checker
+        self.original = self.module.a
+        self.module.a = self.checker
+
+    def tearDown(self):
+        self.module.a = self.original
+
+    def test_grammar_check_from_threads(self):
+        with ThreadPoolExecutor(max_workers=THREADS) as executor:
+            results = list(executor.map(self.checker.grammar_check, self.texts))
+        for text, result, expected in zip(self.texts, results, self.expected):
+            self.assertEqual(result, expected, text)
+
+    def test_route_from_threads(self):
+        app = self.module.app
+
+        def post(text):
+            response = app.test_client().post('/gramcheck/', json={'text': text})
+            self.assertEqual(response.status_code, 200)
+            return response.get_json()['response']
+
+        with ThreadPoolExecutor(max_workers=THREADS) as executor:
+            results = list(executor.map(post, self.texts))
+        for text, result, expected in zip(self.texts, results, self.expected):
+            self.assertEqual(result, expected, text)
+
+    def test_grammar_check_many_from_threads(self):
+        batches = [self.texts[i:i + 10] for i in range(0, len(self.texts), 10)]
+        with ThreadPoolExecutor(max_workers=THREADS) as executor:
+            results = list(executor.map(self.checker.grammar_check_many, batches))
+        for text, result, expected in zip(self.texts, [r for batch in results for r in batch], self.expected):
+            self.assertEqual(result, expected, text)
+
+
+@unittest.skipUnless(can_split_sentences(), "needs Flask and nltk's punkt data")
+class ConcurrencyTest(ConcurrencyChecks, unittest.TestCase):
+    pass
+
+
+class RegexSplitterConcurrencyTest(ConcurrencyChecks, unittest.TestCase):
+    """
+    The same with the texts split by a regex, so it runs without punkt
+    """
+
+    def setUp(self):
+        patcher = mock.patch.object(load_grammar_module(), 'sent_tokenize', regex_sent_tokenize)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        super().setUp()
+
+
+class SpacyTaggerConcurrencyTest(RegexSplitterConcurrencyTest):
+    """
+    The same on the default tagger, whose docs are shared by the checks of a sentence through its TaggedSentence
+    """
+
+    def make_tagger(self):
+        return make_spacy_tagger()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,214 @@
+# Test of the compiled pronoun rules against the checks they replaced: for every pronoun and every word the rules look
+# for right after it, many sentences with random words and tags after them give the same messages, in the same order,
+# as the hand-written check_for_i, check_for_he and check_for_you did.
+# Run with `python -m unittest test_pronoun_rules` or pytest. It needs the grammar module to import, but no model.
+#
+# The checks below are the original ones, with the changes the compiled rules made on purpose: the conditions compare
+# the words without the punctuation around them, 'JJS' 'NNP' is the two tags it was meant to be, and a sentence too
+# short for a check makes only that check not fire, instead of raising. The messages are built exactly as before.
+
+import random
+import string
+import unittest
+from grammar_module import load_grammar_module
+from pronoun_rules import PRONOUN_RULES, RULE_DIC, PronounRules
+from taggers import Token
+
+SENTENCES_PER_PAIR = 300
+WORDS = ['have', 'had', 'been', 'not', 'playing', 'gone', 'dog', 'is', 'am', 'would', 'sing', 'happy']
+TAGS = sorted(set(tag for rule in PRONOUN_RULES for _, kind, value in rule['when'] if kind in ('tag', 'not_tag')
+                  for tag in value) | {'NN', 'MD', 'VB', 'PRP', 'CC'})
+
+
+def check_for_i(s, w, t):
+    """
+    :param s: lower case words of the sentence, which the messages are made of
+    :param w: the same words without the punctuation around them, which the conditions compare
+    :param t: pos tags of the words
+    """
+    return [
+        (3, lambda: w[1] in ['have', 'had'] and w[2] not in ['not'] and t[2] not in ['VBD', 'VBN', 'DT', 'RB'],
+         lambda: "With 'I have/had', second form of the verb should be used (" + s[2].strip('.') + "), like played, gone."),
+        (4, lambda: w[1] == 'have' and w[2] == 'been' and w[3][-3:] != 'ing'
+         and t[3] not in ['JJ', 'VBG', 'RB', 'IN', 'UH', 'VBN', 'VBD'],
+         lambda: "With 'I have been', the verb form should be past tense\
+                             or present participle (" + s[3].strip('.') + "), like playing, gone."),
+        (2, lambda: w[1] == 'been', lambda: "'been' cannot come after 'I'."),
+        (2, lambda: w[1][-3:] == 'ing', lambda: "Present participle form of the verb shouldn't be used (" + s[1] + ")."),
+        (2, lambda: t[1] not in ['NN', 'VBN', 'VB', 'VBD', 'NNS', 'VBP', 'JJ', 'IN', 'UH'] and w[1] not in RULE_DIC['i'],
+         lambda: "Wrong usage of 'I'. 'I' should be used with a verb (work, play, etc.) or modals (would, could, etc)."),
+        (3, lambda: w[2] == 'have' and w[3] == 'been' and t[1] != 'MD',
+         lambda: 'You should use modals (would, could, etc.) after the Pronoun here.'),
+        (3, lambda: w[2] == 'been' and w[1] not in ['have', 'had'],
+         lambda: "You should use have or had after the pronoun here."),
+        (3, lambda: w[1] in ['am', 'was'] and t[2] in ['NN', 'JJS', 'NNP'],
+         lambda: "You should use a determiner (a, an, the, this, etc) before the Noun \
+                           or Superlative adjective."),
+        (3, lambda: w[1] in ['am', 'was'] and t[2] not in ['NN', 'RB', 'JJ', 'VBN', 'IN', 'DT', 'NNP', 'VBP', 'PRP$']
+         and w[2][-3:] != 'ing',
+         lambda: "Present or past participle form of the verb should be used (" + s[2].strip('.')
+         + "), like playing, gone, etc."),
+        (5, lambda: w[3][-3:] != 'ing' and t[4] not in ['JJ', 'VBN', 'VBD'] and w[1] == 'have' and w[2] == 'been',
+         lambda: "With sentence formations like 'I have been' we use present or past participle \
+                                form of the verb (" + s[4].strip('.') + ") like, playing, done, gone, etc."),
+        (3, lambda: t[1] == 'MD' and t[2] not in ['NN', 'VBG', 'RB', 'VB'] and w[2] not in ['have', 'not'],
+         lambda: "After 'I would', verb or adverb should be used like do, play, go, etc."),
+        (5, lambda: w[4][-3:] != 'ing' and t[4] not in ['VBG', 'JJ', 'VBN', 'VBD'] and w[2] == 'have' and w[3] == 'been',
+         lambda: "With sentence formations like 'I would have been' we use present\
+                                 or past participle form of the verb (" + s[4].strip('.')
+         + ") like, playing, gone, etc."),
+    ]
+
+
+def check_for_he(s, w, t):
+    return [
+        (2, lambda: w[1] == 'been', lambda: "'been' should not be used here."),
+        (2, lambda: w[1][-3:] == 'ing',
+         lambda: "Present participle form of the verb shouldn't be used with the pronoun (" + s[1]
+         + "), like playing, singing, etc."),
+        (2, lambda: t[1] not in ['NNS', 'VBZ', 'VBD', 'VBN', 'IN'] and w[1] not in RULE_DIC['he'],
+         lambda: "Pronoun should be used with a third form of verb like plays, works, etc,or modals like would, could, "
+                 "should, etc. (" + s[1] + ")"),
+        (2, lambda: w[1] in ['has', 'had'] and w[2][-3:] != 'ing',
+         lambda: "Second form of the verb should be used with has/had (" + s[2].strip('.') + ") like plays, works, etc."),
+        (4, lambda: w[2] == 'have' and w[3] == 'been' and t[1] != 'MD',
+         lambda: 'You should use modals after the pronoun like would, could, etc.'),
+        (4, lambda: w[2] == 'been' and w[1] not in ['has', 'had'], lambda: "One should use has or had."),
+        (4, lambda: w[3][-3:] != 'ing' and t[3] not in ['JJ', 'VBG', 'RB', 'IN', 'UH', 'VBD', 'VBN']
+         and w[1] in ['has', 'had'] and w[2] == 'been',
+         lambda: "Wrong form of the verb is used here (" + s[3].strip('.') + ")."),
+        (4, lambda: w[1] in ['is', 'was'] and t[2] in ['NN', 'JJS', 'NNP'],
+         lambda: "You should use a determiner before the Noun \
+                            or Superlative adjective like a, an, the, this, etc."),
+        (4, lambda: w[1] in ['is', 'was']
+         and t[2] not in ['JJ', 'VBG', 'UH', 'JJR', 'RB', 'PRP', 'PRP$', 'DT', 'IN', 'VBP', 'NN'] and w[2][-3:] != 'ing',
+         lambda: "The present or past participle form of the verb should be used (" + s[2].strip('.')
+         + ') like playing, done, etc.'),
+        (4, lambda: t[1] == 'MD' and t[2] not in ['NN', 'VB', 'IN'] and w[2] not in ['have', 'not'],
+         lambda: "After a pronoun followed by 'would', a verb or an adverb should be used (" + s[2].strip('.')
+         + ") like sleep, see, etc."),
+        (5, lambda: t[1] == 'MD' and w[4][-3:] != 'ing' and t[4] not in ['JJ', 'VBG', 'RB', 'VBN', 'VBD']
+         and w[2] == 'have' and w[3] == 'been',
+         lambda: "There is some mistake after the noun/pronoun and 'would have been' (" + s[4].strip('.') + ")."),
+    ]
+
+
+def check_for_you(s, w, t):
+    return [
+        (2, lambda: w[1] == 'been', lambda: "'been' cannot come after the pronoun/noun."),
+        (2, lambda: w[1][-3:] == 'ing',
+         lambda: "Present participle form of the verb should NOT be used after the pronoun/noun ( " + s[1]
+         + ") like play, work."),
+        (2, lambda: t[1] not in ['NN', 'VB', 'VBD', 'VBP', 'VBN', 'IN'] and w[1] not in RULE_DIC['you'],
+         lambda: "Pronouns/nouns should be used with a verb or modals (" + s[1] + ") like you love, you sing."),
+        (3, lambda: w[2] == 'have' and w[3] == 'been' and t[1] != 'MD',
+         lambda: 'You should use modals like would, could, etc here.'),
+        (3, lambda: w[2] == 'been' and w[1] not in ['have', 'had'],
+         lambda: "You should use have or had after the pronoun."),
+        (3, lambda: w[1] in ['are', 'were']
+         and t[2] not in ['JJ', 'VBG', 'UH', 'JJR', 'IN', 'VBN', 'RB', 'NNP', 'RB', 'DT', 'JJS'] and w[2][-3:] != 'ing',
+         lambda: "The present or past participle form of the verb should be used (" + s[2].strip('.')
+         + ") like reading, gone, etc."),
+        (4, lambda: w[3][-3:] != 'ing' and t[3] not in ['JJ', 'VBG', 'RB', 'IN', 'UH'] and w[1] in ['have', 'had']
+         and w[2] == 'been',
+         lambda: "With sentence formations like 'you have been' we use present or past participle form of the verb ("
+         + s[3].strip('.') + ") like gone, singing."),
+        (3, lambda: t[1] == 'MD' and t[2] not in ['NN', 'VB'] and w[2] not in ['have', 'not'],
+         lambda: "After 'you would', 'a noun, verb or adverb' is used (" + s[2].strip('.') + ")."),
+        (5, lambda: t[1] == 'MD' and w[4][-3:] != 'ing' and t[4] not in ['JJ', 'VBG'] and w[2] == 'have'
+         and w[3] == 'been',
+         lambda: "With sentence formations like 'you would have been'we use present or past participle form of the verb ("
+         + s[4].strip('.') + ") like told, singing, gone, etc."),
+    ]
+
+
+ORIGINAL_CHECKS = {'i': check_for_i, 'he': check_for_he, 'you': check_for_you}
+
+
+def original_messages(tagged):
+    """
+    The messages of the original check of the pronoun the sentence starts with
+    """
+    s = tagged.lower
+    w = tagged.bare
+    if len(w) < 2 or tagged.text.endswith('?') or w[0] not in ORIGINAL_CHECKS:
+        return []
+    messages = []
+    for length, condition, message in ORIGINAL_CHECKS[w[0]](s, w, tagged.tags):
+        try:
+            if len(w) >= length and condition():
+                messages.append(message())
+        except IndexError:
+            pass
+    return messages
+
+
+def next_words(pronoun):
+    """
+    The words the rules of the pronoun look for right after it, the words it can always be followed by and a few which
+    only the tags decide on
+    """
+    words = set(RULE_DIC[pronoun]) | {'been', 'playing', 'go', 'dog', 'not'}
+    for rule in PRONOUN_RULES:
+        for position, kind, value in rule['when']:
+            if rule['pronoun'] == pronoun and position == 1 and kind in ('word', 'not_word'):
+                words.update(value)
+    return sorted(words)
+
+
+def make_tagged(module, rng, pronoun, next_word):
+    """
+    A sentence starting with the pronoun and the word, then up to three random words or 'have been' and a random word,
+    which most of the longer rules look for, with a random tag for every word
+    """
+    if rng.random() < 0.3:
+        rest = ['have', 'been', rng.choice(WORDS)]
+    else:
+        rest = [rng.choice(WORDS) for _ in range(rng.randint(0, 3))]
+    words = [rng.choice([pronoun, pronoun.capitalize()]), next_word] + rest
+    ending = rng.choice(['', '.', '!', ','])
+    sentence = ' '.join(words) + ending
+    tokens = []
+    offset = 0
+    for word in words:
+        tokens.append(Token(word, offset, rng.choice(TAGS), False, False))
+        offset += len(word) + 1
+    if ending:
+        tokens.append(Token(ending, len(sentence) - 1, ending, True, False))
+    return module.TaggedSentence(sentence, tokens)
+
+
+class PronounRulesTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.module = load_grammar_module()
+        cls.rules = PronounRules()
+
+    def test_same_messages_as_the_original_checks(self):
+        rng = random.Random(0)
+        for pronoun in ORIGINAL_CHECKS:
+            for next_word in next_words(pronoun):
+                for _ in range(SENTENCES_PER_PAIR):
+                    tagged = make_tagged(self.module, rng, pronoun, next_word)
+                    found = [message for _, message in self.rules.match(tagged)]
+                    self.assertEqual(found, original_messages(tagged), (tagged.text, tagged.tags))
+
+    def test_message_words_keep_their_punctuation_like_the_original(self):
+        tokens = [Token('He', 0, 'PRP', False, False), Token('go', 3, 'VB', False, False),
+                  Token('.', 5, '.', True, False)]
+        tagged = self.module.TaggedSentence('He go.', tokens)
+        self.assertEqual(self.rules.match(tagged), [
+            ('HE_NEEDS_VERB', "Pronoun should be used with a third form of verb like plays, works, etc,or modals like "
+                              "would, could, should, etc. (go.)")])
+
+    def test_every_message_word_is_a_position_of_the_rule(self):
+        for rule in PRONOUN_RULES:
+            positions = set(position for position, _, _ in rule['when'])
+            for _, field, _, _ in string.Formatter().parse(rule['message']):
+                if field is not None:
+                    self.assertIn(int(field), positions, rule['id'])
+
+
+if __name__ == '__main__':
+    unittest.main()